@@ -1,40 +1,128 @@
 import streamlit as st
-import pandas as pd
 import datetime
-import json
+import importlib
 import os
-from script.fetch_data import fetch_report, homepage_check, news_search
-from script.annual_report_insight import parse_annual_report, analyse_annual_report
-from script.company_bg_insight import find_company_bg_insights
+import html
+import time
+from script.manifest import artifact_date, read_manifest
+from script.jobs import runner
+from script.news_store import news_path
+from script.companies import DEFAULT_COMPANY_ID
+from script import metrics
 
 def get_update_dates(homepage_filename, news_filename, annual_report_filename):
-    dates = []
-
-    # Get the date from the homepage JSON file
-    try:
-        with open(homepage_filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            dates.append(data['date'])
-    except FileNotFoundError:
-        dates.append(None)
-
-    # Get the date from the news JSON file
-    try:
-        with open(news_filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            dates.append(data['date'])
-    except FileNotFoundError:
-        dates.append(None)
-
-    # Get the date from the annual report JSON file
-    try:
-        with open(annual_report_filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            dates.append(data['date'])
-    except FileNotFoundError:
-        dates.append(None)
-
-    return dates
+    # Dates come from data/manifest.json, the artifacts are only read if they are missing from it
+    return [
+        artifact_date('homepage', homepage_filename),
+        artifact_date('news', news_filename),
+        artifact_date('annual_report', annual_report_filename),
+    ]
+
+
+def pipeline(module_name, func_name):
+    # Pipeline stages are imported on first use, so opening a page does not load the SDKs
+    return getattr(importlib.import_module(f'script.{module_name}'), func_name)
+
+
+def start_job(stage, func, *args, key_input=None, **kwargs):
+    # Submit a stage to the shared job runner, identical running jobs are reused
+    job = runner.submit(stage, func, *args, key_input=key_input, **kwargs)
+    st.session_state.jobs[stage] = job.id
+    return job
+
+
+def session_job(stage):
+    job_id = st.session_state.jobs.get(stage)
+    return runner.get(job_id) if job_id else None
+
+
+def manifest_hash(*names):
+    # Content hashes of the artifacts a stage reads, so a job is only shared for identical inputs
+    manifest = read_manifest()
+    return [manifest.get(name, {}).get('sha256') for name in names]
+
+
+def poll_jobs(jobs_and_renders, interval=0.5):
+    # Re-render each job's status until all of them finish. Jobs run in the background,
+    # so any interaction simply reruns the script and polling resumes on the next run.
+    while True:
+        done = all(job.done for job, _ in jobs_and_renders)
+        for job, render in jobs_and_renders:
+            render(job)
+        if done:
+            return
+        time.sleep(interval)
+
+
+def poll_job(job, render, interval=0.5):
+    poll_jobs([(job, render)], interval)
+
+
+def render_progress(progress_placeholder, progress_bar):
+    def render(job):
+        progress_placeholder.markdown(f"""
+            <div class="progress-text-area">
+                {"<br>".join(html.escape(message) for message in job.progress_messages)}
+            </div>
+        """, unsafe_allow_html=True)
+        progress_bar.progress(min(max(job.progress, 0.0), 1.0))
+    return render
+
+
+def render_job_message(job, success_message):
+    if job.status == 'failed':
+        st.error(f"{job.stage} failed: {job.error.splitlines()[0]}")
+    else:
+        st.success(success_message)
+
+
+def render_result_textarea(text):
+    return f'<textarea style="width: 100%; height: 400px; background-color: black; color: white;">{html.escape(text)}</textarea>'
+
+def render_metrics_panel():
+    import pandas as pd
+    summary = metrics.stage_summary()
+    if not summary:
+        st.sidebar.caption("No metrics recorded yet.")
+        return
+    rows = []
+    for stage, row in sorted(summary.items()):
+        lookups = row['cache_hits'] + row['cache_misses']
+        rows.append({
+            'stage': stage,
+            'calls': row['calls'],
+            'errors': row['errors'],
+            'avg s': round(row['seconds'] / row['calls'], 3) if row['calls'] else 0,
+            'total s': round(row['seconds'], 1),
+            'MB': round(row['bytes'] / 1e6, 2),
+            'tokens in': row['prompt_tokens'],
+            'tokens out': row['completion_tokens'],
+            'cache hit %': round(100 * row['cache_hits'] / lookups) if lookups else None,
+        })
+    st.sidebar.dataframe(pd.DataFrame(rows).set_index('stage'))
+    st.sidebar.caption(f"Trace and Prometheus snapshot in {metrics.METRICS_DIR}/")
+
+# Default selections of the multi-year trend charts
+TREND_AMOUNTS = ['revenue', 'net_income', 'operating_cash_flow', 'free_cash_flow']
+TREND_RATIOS = ['net_margin', 'return_on_equity', 'debt_to_equity']
+
+
+def render_trends(company_id=DEFAULT_COMPANY_ID):
+    # Line charts of the figures in the multi-year fact store, only the chosen keys are read
+    keys = pipeline('fact_store', 'available_keys')(company_id)
+    if not keys:
+        st.caption("No multi-year figures yet, build the history first.")
+        return
+    read_trend = pipeline('fact_store', 'read_trend')
+    amount_keys = keys.get('item', []) + keys.get('amount', [])
+    ratio_keys = keys.get('ratio', [])
+    amounts = st.multiselect("Amounts (millions)", amount_keys, [key for key in TREND_AMOUNTS if key in amount_keys])
+    if amounts:
+        st.line_chart(read_trend(company_id, amounts))
+    ratios = st.multiselect("Ratios", ratio_keys, [key for key in TREND_RATIOS if key in ratio_keys])
+    if ratios:
+        st.line_chart(read_trend(company_id, ratios))
+
 
 # Main function to create the Streamlit app
 def main():
@@ -78,8 +166,8 @@ def main():
     # Initialize session state for page navigation
     if 'page' not in st.session_state:
         st.session_state.page = "Company Background Search"
-    if 'progress_messages' not in st.session_state:
-        st.session_state.progress_messages = []
+    if 'jobs' not in st.session_state:
+        st.session_state.jobs = {}
 
     # Page navigation buttons
     if st.sidebar.button("Company Background Search"):
@@ -89,6 +177,10 @@ def main():
     if st.sidebar.button("Annual Report Insight"):
         st.session_state.page = "Annual Report Insight"
 
+    # Optional panel with the stage metrics recorded by this process
+    if st.sidebar.checkbox("Show pipeline metrics"):
+        render_metrics_panel()
+
 
 
 
@@ -102,7 +194,7 @@ def main():
         st.markdown('<div class="spacer"></div>', unsafe_allow_html=True)
 
         # Get the update dates
-        dates = get_update_dates('data/homepage_data.json', 'data/news_data.json', 'data/annual_report.json')
+        dates = get_update_dates('data/homepage_data.json', news_path('data'), 'data/annual_report.json')
 
         # Fallback to current date if no date is found
         current_date = datetime.datetime.now().strftime("%Y%m%d")
@@ -117,6 +209,7 @@ def main():
             "News": [news_date],
             "Annual Report": [annual_report_date]
         }
+        import pandas as pd
         df = pd.DataFrame(data)
         st.table(df.style.hide(axis='index'))
 
@@ -129,26 +222,31 @@ def main():
         with col3:
             annual_report_extractor_clicked = st.button("Annual Report Extractor")
 
-        # Full-width progress text box and bar
         if homepage_check_clicked:
-            progress_placeholder = st.empty()
-            progress_bar = st.progress(0)
-            for progress_messages, progress_percentage in homepage_check():
-                st.session_state.progress_messages = progress_messages
-                progress_placeholder.markdown(f"""
-                    <div class="progress-text-area">
-                        {"<br>".join(st.session_state.progress_messages)}
-                    </div>
-                """, unsafe_allow_html=True)
-                progress_bar.progress(progress_percentage)
-
+            start_job('homepage_check', pipeline('fetch_data', 'homepage_check'))
         if news_search_clicked:
-            news_search()
-            st.success("News articles have been processed and saved.")
-
+            start_job('news_search', pipeline('fetch_data', 'news_search'))
         if annual_report_extractor_clicked:
-            fetch_report()
-            st.success("Annual report has been downloaded and saved.")
+            start_job('fetch_report', pipeline('fetch_data', 'fetch_report'))
+
+        # Full-width progress text box and bar for each running or finished stage
+        success_messages = {
+            'homepage_check': "All links have been processed.",
+            'news_search': "News articles have been processed and saved.",
+            'fetch_report': "Annual report has been downloaded and saved.",
+        }
+        stage_jobs = []
+        for stage, success_message in success_messages.items():
+            job = session_job(stage)
+            if job is not None:
+                progress_placeholder = st.empty()
+                progress_bar = st.progress(0)
+                message_placeholder = st.empty()
+                stage_jobs.append((job, render_progress(progress_placeholder, progress_bar), message_placeholder, success_message))
+        poll_jobs([(job, render) for job, render, _, _ in stage_jobs])
+        for job, _, message_placeholder, success_message in stage_jobs:
+            with message_placeholder.container():
+                render_job_message(job, success_message)
 
 
 
@@ -163,10 +261,21 @@ def main():
 
         # Button to analyze company background
         if st.button("Analyze Company Background"):
-            # Call the function and get the insights
-            insights = find_company_bg_insights()
-            # Display the result in the text area
-            st.text_area("Result", insights, height=400)
+            start_job(
+                'find_company_bg_insights', pipeline('company_bg_insight', 'find_company_bg_insights'), stream=True,
+                key_input=manifest_hash('news', 'homepage'),
+            )
+
+        job = session_job('find_company_bg_insights')
+        if job is not None:
+            # Stream the insights into the text area as they are generated
+            result_placeholder = st.empty()
+            poll_job(job, lambda job: result_placeholder.markdown(
+                render_result_textarea(job.output or "\n".join(job.progress_messages)),
+                unsafe_allow_html=True,
+            ))
+            if job.status == 'failed':
+                render_job_message(job, None)
         else:
             # Default text area content
             st.text_area("Result", "Company background analysis result will be shown here...", height=500)
@@ -182,7 +291,7 @@ def main():
         st.markdown('<div class="spacer"></div>', unsafe_allow_html=True)
 
         # Create columns for buttons
-        col1, col2 = st.columns(2)
+        col1, col2, col3 = st.columns(3)
 
         # Container for success messages
         message_container = st.container()
@@ -193,21 +302,53 @@ def main():
         # Button to parse annual reports
         with col1:
             if st.button("Parse Annual Reports"):
-                parse_annual_report()
-                with message_container:
-                    st.success("Annual report has been parsed and saved.")
+                start_job('parse_annual_report', pipeline('annual_report_insight', 'parse_annual_report'), key_input=manifest_hash('annual_report_pdf'))
 
         # Button to analyze annual reports
         with col2:
             if st.button("Analyze Annual Reports"):
-                analysis_result = analyse_annual_report()
-                with message_container:
-                    st.success("Annual report analysis has been completed.")
-                with analysis_result_container:
-                    st.markdown(
-                        f'<textarea style="width: 100%; height: 400px; background-color: black; color: white;">{analysis_result}</textarea>',
-                        unsafe_allow_html=True
-                    )
+                start_job(
+                    'analyse_annual_report', pipeline('annual_report_insight', 'analyse_annual_report'), stream=True,
+                    key_input=manifest_hash('annual_report'),
+                )
+
+        # Button to add every fetched year to the multi-year fact store
+        with col3:
+            if st.button("Build Multi-Year History"):
+                start_job('update_fact_store', pipeline('annual_report_insight', 'update_fact_store'), key_input=manifest_hash('annual_report'))
+
+        job = session_job('parse_annual_report')
+        if job is not None:
+            with message_container:
+                progress_placeholder = st.empty()
+                progress_bar = st.progress(0)
+            poll_job(job, render_progress(progress_placeholder, progress_bar))
+            with message_container:
+                render_job_message(job, "Annual report has been parsed and saved.")
+
+        job = session_job('analyse_annual_report')
+        if job is not None:
+            with analysis_result_container:
+                result_placeholder = st.empty()
+            # Stream the insights into the text area as they are generated
+            poll_job(job, lambda job: result_placeholder.markdown(
+                render_result_textarea(job.output or "\n".join(job.progress_messages)),
+                unsafe_allow_html=True,
+            ))
+            with message_container:
+                render_job_message(job, "Annual report analysis has been completed.")
+
+        job = session_job('update_fact_store')
+        if job is not None:
+            with message_container:
+                progress_placeholder = st.empty()
+                progress_bar = st.progress(0)
+            poll_job(job, render_progress(progress_placeholder, progress_bar))
+            with message_container:
+                render_job_message(job, "Multi-year history has been updated.")
+
+        if st.checkbox("Show multi-year trends"):
+            render_trends()
         
 if __name__ == "__main__":
     main()
@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+# Import-time regression check based on `python -X importtime`.
+# Each target is imported in a fresh interpreter several times and the fastest run
+# is compared with its budget in import_budget.json. Budgets exclude the packages
+# listed under "exclude" (e.g. streamlit for app.py), and the modules listed under
+# "lazy" must not be imported at all. Usage:
+#   python -m benchmarks.importtime            # exits 1 when a budget is exceeded
+#   python -m benchmarks.importtime --top 15   # also list the slowest modules
+BUDGET_PATH = os.path.join(os.path.dirname(__file__), 'import_budget.json')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LINE_PATTERN = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def import_times(module):
+    # [(module, self_us, cumulative_us, depth)] in the order reported
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _LINE_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries
+
+
+def target_entries(module, entries):
+    # The entries of module's own import; interpreter start-up imports are reported before it
+    end = next(i for i, entry in enumerate(entries) if entry[0] == module and entry[3] == 0)
+    start = end
+    while start > 0 and entries[start - 1][3] > 0:
+        start -= 1
+    return entries[start:end + 1]
+
+
+def split_excluded(entries, exclude):
+    # (kept, excluded) entries; everything an excluded package imports is excluded with it
+    def is_excluded(name):
+        return any(name == root or name.startswith(root + '.') for root in exclude)
+
+    excluded = []
+    pending = []  # (depth, entries of the subtree) of imports whose parent is not reported yet
+    for entry in entries:
+        # Children are reported before their parent, one level deeper
+        subtree = []
+        while pending and pending[-1][0] > entry[3]:
+            subtree = pending.pop()[1] + subtree
+        subtree.append(entry)
+        if is_excluded(entry[0]):
+            excluded.extend(subtree)
+        else:
+            pending.append((entry[3], subtree))
+    kept = [entry for _, subtree in pending for entry in subtree]
+    return kept, excluded
+
+
+def measure(module, exclude=(), repeat=5):
+    # Fastest cumulative import time in ms without the excluded packages, and the kept entries
+    best = None
+    for _ in range(repeat):
+        entries = target_entries(module, import_times(module))
+        kept, excluded = split_excluded(entries, exclude)
+        ms = (entries[-1][2] - sum(self_us for _, self_us, _, _ in excluded)) / 1000
+        if best is None or ms < best[0]:
+            best = (ms, kept)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check import times against their budgets.")
+    parser.add_argument('--budget', default=BUDGET_PATH, help="budget JSON file")
+    parser.add_argument('--repeat', type=int, default=5, help="imports per target, the fastest counts")
+    parser.add_argument('--top', type=int, default=0, help="list this many slowest modules per target")
+    args = parser.parse_args(argv)
+
+    with open(args.budget, 'r', encoding='utf-8') as f:
+        budgets = json.load(f)
+
+    failed = False
+    for target, budget in budgets.items():
+        ms, entries = measure(target, budget.get('exclude', []), args.repeat)
+        imported = {name for name, _, _, _ in entries}
+        eager = sorted(name for name in budget.get('lazy', []) if name in imported)
+        ok = ms <= budget['ms'] and not eager
+        failed = failed or not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {target:<36} {ms:8.1f} ms  (budget {budget['ms']} ms)")
+        if eager:
+            print(f"     imported eagerly: {', '.join(eager)}")
+        for name, self_us, _, _ in sorted(entries, key=lambda entry: -entry[1])[:args.top]:
+            print(f"     {self_us / 1000:8.1f} ms  {name}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from script import http_cache, limits
+from script.fetch_data import homepage_check, news_search
+from script.annual_report_insight import (
+    analyse_annual_report, build_markdown_table, findall_pages_idx_and_numbers,
+)
+from script.report_store import ReportStore, save_report_store
+from benchmarks.stubs import StubServer
+from benchmarks.synthetic import STATEMENTS, make_layout_result, statement_pages
+
+# Offline benchmarks of the pipeline stages, run against the local stand-ins in
+# benchmarks/stubs.py and synthetic layout results from benchmarks/synthetic.py.
+# Everything runs in a temporary working directory, so the caches under data/ are
+# neither used nor touched. Usage:
+#   python -m benchmarks.run --pages 500 --tables 3000 --latency 0.2 --repeat 5
+INSIGHTS_TEXT = ' '.join(f"[{i}] Line item {i}: figures and calculation." for i in range(1, 26))
+
+
+def make_responder(page_count):
+    def responder(messages):
+        system_prompt = messages[0]['content'] if messages else ''
+        if 'identify specific financial statements' in system_prompt:
+            return json.dumps([[name, str(page)] for name, page in zip(STATEMENTS, statement_pages(page_count))])
+        if 'classify each statement name' in system_prompt:
+            return json.dumps(['na'] * len(json.loads(messages[-1]['content'])))
+        return INSIGHTS_TEXT
+    return responder
+
+
+def configure(base_url):
+    # Point every client at the local stand-ins; set before the settings are first
+    # loaded, and .env never overrides variables that are already set
+    os.environ.update({
+        'AZURE_GPT_API_TYPE': 'azure',
+        'AZURE_GPT_API_BASE': base_url,
+        'AZURE_GPT_API_VERSION': '2023-05-15',
+        'AZURE_GPT_API_KEY': 'local',
+        'AZURE_GPT_ENGINE': 'local',
+        'NEWS_API_KEY': 'local',
+        'NEWS_API_URL': base_url + '/v2/everything',
+    })
+    # Measure the pipeline, not the production rate limits
+    for name in list(limits.DEFAULT_RATES):
+        limits.DEFAULT_RATES[name] = 1e6
+
+
+def timed(func, repeat, setup=None):
+    # Seconds per run, setup() runs untimed before each one
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def run_benchmarks(pages, tables, latency, repeat, homepage_pages):
+    results = {}
+    with StubServer(make_responder(pages), latency) as server:
+        configure(server.base_url)
+        company = {
+            'id': 'bench',
+            'name': 'Benchmark',
+            'homepage_links': [f"{server.base_url}/site/{i}" for i in range(homepage_pages)],
+            'news_query': 'railway',
+        }
+
+        def clear_http_cache():
+            shutil.rmtree('data/http_cache', ignore_errors=True)
+            http_cache._index = None
+
+        def drain(generator):
+            for _ in generator:
+                pass
+
+        results['homepage_check (cold)'] = timed(lambda: drain(homepage_check(company, 'data')), repeat, clear_http_cache)
+        results['homepage_check (warm)'] = timed(lambda: drain(homepage_check(company, 'data')), repeat)
+        results['news_search'] = timed(lambda: news_search(company, 'data', incremental=False), repeat)
+
+        layout = make_layout_result(pages, tables)
+        store_dir = os.path.join('data', 'annual_report_store')
+        results['save_report_store'] = timed(lambda: save_report_store(layout, store_dir), repeat)
+
+        results['findall_pages_idx_and_numbers'] = timed(lambda: findall_pages_idx_and_numbers(ReportStore(store_dir)), repeat)
+        store = ReportStore(store_dir)
+        results[f'build_markdown_table x{store.table_count}'] = timed(
+            lambda: [build_markdown_table(store.table(idx)) for idx in range(store.table_count)], repeat,
+        )
+
+        def clear_llm_cache():
+            if os.path.exists('data/llm_cache.sqlite'):
+                os.remove('data/llm_cache.sqlite')
+
+        results['analyse_annual_report'] = timed(lambda: analyse_annual_report(data_dir='data'), repeat, clear_llm_cache)
+        results['analyse_annual_report (llm cache)'] = timed(lambda: analyse_annual_report(data_dir='data'), repeat)
+    return results
+
+
+def print_results(results):
+    width = max(len(name) for name in results)
+    print(f"{'benchmark':<{width}}  {'min s':>9}  {'median s':>9}  {'max s':>9}")
+    for name, times in results.items():
+        print(f"{name:<{width}}  {min(times):9.4f}  {statistics.median(times):9.4f}  {max(times):9.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the pipeline stages offline against local stand-ins.")
+    parser.add_argument('--pages', type=int, default=500, help="pages in the synthetic report")
+    parser.add_argument('--tables', type=int, default=3000, help="tables in the synthetic report")
+    parser.add_argument('--homepage-pages', type=int, default=9, help="homepage links to fetch")
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds the fake OpenAI endpoint waits per response")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per benchmark")
+    parser.add_argument('--output', help="also write the raw timings to this JSON file")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix='company-insight-bench-')
+    os.chdir(work_dir)
+    try:
+        results = run_benchmarks(args.pages, args.tables, args.latency, args.repeat, args.homepage_pages)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'python': sys.version, 'results': results}, f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# Local stand-ins for the upstream services, all served by one threaded HTTP server:
+#   /site/<n>                                   synthetic homepage pages
+#   /report/<year>                              annual report pages linking to /pdf/<year>.pdf
+#   /pdf/<name>                                 a small placeholder PDF
+#   /v2/everything                              the News API
+#   /openai/deployments/<engine>/chat/completions   Azure OpenAI chat completions (plain and streamed)
+# Pages carry an ETag so the HTTP cache sees 304s on repeated runs.
+PARAGRAPHS_PER_PAGE = 60
+NEWS_TOTAL_RESULTS = 250
+PDF_BODY = b"%PDF-1.4\n1 0 obj << /Type /Pages /Count 1 >> endobj\n%%EOF\n"
+
+
+def site_page(n):
+    paragraphs = ''.join(
+        f"<p>Section {i} of page {n}: railway operations, property development and station retail.</p>"
+        for i in range(PARAGRAPHS_PER_PAGE)
+    )
+    return (
+        f"<html><head><title>Page {n}</title><style>p {{ margin: 0 }}</style></head>"
+        f"<body><nav>Home | About | Investors</nav><main>{paragraphs}</main><footer>Copyright</footer></body></html>"
+    ).encode('utf-8')
+
+
+def report_page(year):
+    return f'<html><body><a title="here" href="/pdf/{year}.pdf">Annual Report {year}</a></body></html>'.encode('utf-8')
+
+
+def news_page(page, page_size):
+    first = (page - 1) * page_size
+    articles = [
+        {
+            'source': {'id': None, 'name': 'Local News'},
+            'author': 'Reporter',
+            'title': f"Article {i}",
+            'description': f"Description of article {i} about the railway.",
+            'url': f"https://news.example/{i}",
+            'publishedAt': f"2024-01-{1 + i % 28:02d}T{i % 24:02d}:00:00Z",
+            'content': f"Body of article {i}. " * 20,
+        }
+        for i in range(first, min(first + page_size, NEWS_TOTAL_RESULTS))
+    ]
+    return {'status': 'ok', 'totalResults': NEWS_TOTAL_RESULTS, 'articles': articles}
+
+
+class StubServer:
+    # responder(messages) -> completion text; latency: seconds before each chat response
+    def __init__(self, responder=None, latency=0.0):
+        self.responder = responder or (lambda messages: "[]")
+        self.latency = latency
+        self.requests = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type='text/html', headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_cacheable(self, body, content_type='text/html'):
+                etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self._send(200, body, content_type, {'ETag': etag})
+
+            def do_GET(self):
+                stub.requests += 1
+                url = urlsplit(self.path)
+                parts = url.path.strip('/').split('/')
+                if parts[0] == 'site' and len(parts) == 2:
+                    self._send_cacheable(site_page(parts[1]))
+                elif parts[0] == 'report' and len(parts) == 2:
+                    self._send_cacheable(report_page(parts[1]))
+                elif parts[0] == 'pdf':
+                    self._send_cacheable(PDF_BODY, 'application/pdf')
+                elif url.path == '/v2/everything':
+                    query = parse_qs(url.query)
+                    page = int(query.get('page', ['1'])[0])
+                    page_size = int(query.get('pageSize', ['100'])[0])
+                    self._send(200, json.dumps(news_page(page, page_size)).encode('utf-8'), 'application/json')
+                else:
+                    self._send(404, b'not found')
+
+            def do_POST(self):
+                stub.requests += 1
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if not self.path.split('?')[0].endswith('/chat/completions'):
+                    self._send(404, b'not found')
+                    return
+                time.sleep(stub.latency)
+                text = stub.responder(body.get('messages') or [])
+                if body.get('stream'):
+                    self._stream(text)
+                    return
+                response = {
+                    'id': 'chatcmpl-local',
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': 'local',
+                    'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': text}}],
+                    'usage': {
+                        'prompt_tokens': sum(len(m.get('content') or '') for m in body.get('messages') or []) // 4,
+                        'completion_tokens': len(text) // 4,
+                        'total_tokens': 0,
+                    },
+                }
+                self._send(200, json.dumps(response).encode('utf-8'), 'application/json')
+
+            def _stream(self, text):
+                # Server-sent events, one chunk per word
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                for word in text.split(' '):
+                    chunk = {'object': 'chat.completion.chunk', 'choices': [{'index': 0, 'delta': {'content': word + ' '}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
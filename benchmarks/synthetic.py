@@ -0,0 +1,87 @@
+import random
+
+# Synthetic Document Intelligence prebuilt-layout results, shaped like
+# result.to_dict() with only the fields the pipeline reads (content, pages with
+# lines, tables with cells and bounding regions).
+STATEMENTS = [
+    "CONSOLIDATED STATEMENT OF PROFIT OR LOSS",
+    "CONSOLIDATED STATEMENT OF COMPREHENSIVE INCOME",
+    "CONSOLIDATED STATEMENT OF FINANCIAL POSITION",
+    "CONSOLIDATED STATEMENT OF CHANGES IN EQUITY",
+    "CONSOLIDATED STATEMENT OF CASH FLOWS",
+]
+LINE_ITEMS = [
+    "Revenue", "Operating expenses", "Depreciation and amortisation", "Interest expense",
+    "Profit before taxation", "Income tax", "Profit for the year", "Non-controlling interests",
+    "Investment properties", "Cash and cash equivalents", "Bank loans", "Total equity",
+]
+
+
+def statement_pages(page_count):
+    # Printed page numbers of the statements, listed on the Contents page
+    first = max(6, page_count * 2 // 3)
+    return [first + 2 * i for i in range(len(STATEMENTS))]
+
+
+def contents_lines(page_count):
+    lines = ["CONTENTS", "CORPORATE INFORMATION 2", "CHAIRMAN'S STATEMENT 4"]
+    lines.extend(f"{name} {page}" for name, page in zip(STATEMENTS, statement_pages(page_count)))
+    return lines
+
+
+def make_table(rng, page_number, rows=20, columns=4):
+    # A statement-like table: a two-row header with a spanned year group, then line items
+    cells = [
+        {'kind': 'columnHeader', 'row_index': 0, 'column_index': 0, 'row_span': 2, 'column_span': 1, 'content': 'HK$ million'},
+        {'kind': 'columnHeader', 'row_index': 0, 'column_index': 1, 'row_span': 1, 'column_span': columns - 1, 'content': 'Year ended 31 December'},
+    ]
+    for col in range(1, columns):
+        cells.append({'kind': 'columnHeader', 'row_index': 1, 'column_index': col, 'row_span': 1, 'column_span': 1,
+                      'content': str(2023 - col + 1)})
+    for row in range(2, rows):
+        cells.append({'kind': 'content', 'row_index': row, 'column_index': 0, 'row_span': 1, 'column_span': 1,
+                      'content': rng.choice(LINE_ITEMS)})
+        for col in range(1, columns):
+            value = rng.randint(-50000, 50000)
+            text = f"({abs(value):,})" if value < 0 else f"{value:,}"
+            cells.append({'kind': 'content', 'row_index': row, 'column_index': col, 'row_span': 1, 'column_span': 1,
+                          'content': text})
+    return {
+        'row_count': rows,
+        'column_count': columns,
+        'cells': cells,
+        'bounding_regions': [{'page_number': page_number, 'polygon': []}],
+        'spans': [],
+    }
+
+
+def make_layout_result(page_count=500, table_count=3000, lines_per_page=40, seed=0):
+    # The Contents page is page 1; each statement page (printed number + 1) holds
+    # a few tables and the remaining tables are spread over the other pages
+    rng = random.Random(seed)
+    statement_page_numbers = {page + 1 for page in statement_pages(page_count)}
+    # Statement titles are printed at the top of their page
+    titles = {page + 1: name for name, page in zip(STATEMENTS, statement_pages(page_count))}
+    pages = []
+    for page_number in range(1, page_count + 1):
+        if page_number == 1:
+            texts = contents_lines(page_count)
+        else:
+            texts = [f"Page {page_number} line {i} " + ' '.join(rng.choices(LINE_ITEMS, k=6)) for i in range(lines_per_page)]
+            if page_number in titles:
+                texts = ["MTR Corporation Limited", titles[page_number], "for the year ended 31 December 2023"] + texts
+        pages.append({
+            'page_number': page_number,
+            'lines': [{'content': text, 'polygon': [], 'spans': []} for text in texts],
+        })
+
+    table_page_numbers = []
+    for page_number in sorted(statement_page_numbers):
+        table_page_numbers.extend([page_number] * 3)
+    other_pages = [n for n in range(2, page_count + 1) if n not in statement_page_numbers]
+    while len(table_page_numbers) < table_count and other_pages:
+        table_page_numbers.append(rng.choice(other_pages))
+    tables = [make_table(rng, page_number) for page_number in sorted(table_page_numbers[:table_count])]
+
+    content = '\n'.join(line['content'] for page in pages for line in page['lines'])
+    return {'content': content, 'pages': pages, 'tables': tables, 'paragraphs': []}
@@ -1,59 +1,206 @@
 import os
 import json
-import pickle
-from azure.ai.formrecognizer import DocumentAnalysisClient
-from azure.core.credentials import AzureKeyCredential
-from dotenv import load_dotenv
-import openai
+from script.config import get_settings
+from script.llm import chat_completion, chat_completion_stream
+from script.report_store import save_report_store, load_report_store
+from script.tables import assemble_table_grid, stacked_header
+from script.page_index import locate_statements, LOCATE_CONFIDENCE_THRESHOLD
+from script.manifest import update_manifest, write_json_artifact
+from script.jobs import report_progress
+from script.document_shards import analyze_sharded, count_pdf_pages, SHARD_PAGES
+from script.companies import DATA_DIR, get_company
+from script.limits import call_api
+from script import metrics
 import time
 import re
-from tabulate import tabulate
-import pandas as pd
+import difflib
 import ast
 
-# Load environment variables from .env file
-load_dotenv()
-openai.api_key = os.getenv('AZURE_GPT_API_KEY')
-openai.api_base = os.getenv('AZURE_GPT_API_BASE')
-openai.api_version = os.getenv('AZURE_GPT_API_VERSION')
-openai.api_type = os.getenv('AZURE_GPT_API_TYPE')
-openai.engine = os.getenv('AZURE_GPT_ENGINE')
 
+# Two-pass parsing: pages holding the Contents page, and pages kept around each statement
+CONTENTS_PAGES = 5
+STATEMENT_PAGE_MARGIN = 3
+STATEMENT_MAX_PAGES = 6
+# Margin of the retry when the statements are not all on the pages of the second pass
+# (front matter shifting the printed numbers); after that the full report is analysed
+STATEMENT_PAGE_WIDE_MARGIN = 12
 
-def parse_annual_report():
-    # Load the API key and endpoint from environment variables
-    key = os.getenv('AZURE_DI_API_KEY')
-    endpoint = os.getenv('AZURE_DI_ENDPOINT')
-    
+
+def get_document_analysis_client():
+    # The Azure SDK is only imported when a report is parsed
+    from azure.ai.formrecognizer import DocumentAnalysisClient
+    from azure.core.credentials import AzureKeyCredential
+    settings = get_settings()
+    return DocumentAnalysisClient(endpoint=settings.di_endpoint, credential=AzureKeyCredential(settings.di_api_key))
+
+
+def analyze_document(client, pth, pages=None):
+    # Run prebuilt-layout on the whole PDF, or only on pages (e.g. "1-5,108-125")
+    with metrics.span('document_intelligence', pages=pages, bytes=os.path.getsize(pth)):
+        return call_api('document_intelligence', _analyze_document, client, pth, pages)
+
+
+def _analyze_document(client, pth, pages):
+    with open(pth, "rb") as f:
+        poller = client.begin_analyze_document(
+            "prebuilt-layout", document=f, locale="en-US", pages=pages,
+        )
+    return poller.result().to_dict()
+
+
+def statement_page_ranges(statements_and_page_numbers, margin=STATEMENT_PAGE_MARGIN, page_count=None):
+    # PDF page ranges to analyse for the statements found on the Contents page.
+    # Printed page numbers are used as page indices, so page number = printed number + 1.
+    # Entries without a usable page number ("N/A") are skipped; '' when none is left.
+    starts = []
+    for statement in statements_and_page_numbers:
+        try:
+            starts.append(int(statement[1]) + 1)
+        except (ValueError, TypeError, IndexError):
+            continue
+    starts.sort()
+    ranges = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] - 1 if i + 1 < len(starts) else start + 2
+        end = min(end, start + STATEMENT_MAX_PAGES - 1)
+        first, last = max(1, start - margin), end + margin
+        if page_count:
+            first, last = min(first, page_count), min(last, page_count)
+        if ranges and first <= ranges[-1][1] + 1:
+            ranges[-1][1] = max(ranges[-1][1], last)
+        else:
+            ranges.append([first, last])
+    return ','.join(f"{first}-{last}" for first, last in ranges)
+
+
+def page_range_numbers(pages):
+    # "1-5,108-125" -> {1, ..., 5, 108, ..., 125}
+    numbers = set()
+    for part in filter(None, pages.split(',')):
+        first, _, last = part.partition('-')
+        numbers.update(range(int(first), int(last or first) + 1))
+    return numbers
+
+
+def format_page_ranges(numbers):
+    # {1, 2, 3, 7} -> "1-3,7-7"
+    ranges = []
+    for number in sorted(numbers):
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ','.join(f"{first}-{last}" for first, last in ranges)
+
+
+def statements_located(result_dict, store_dir):
+    # Save result_dict in the report store and check that every statement is found on its pages:
+    # its title on a stored page it owns, and no other page competing with it
+    save_report_store(result_dict, store_dir)
+    located = locate_statements(load_report_store(store_dir), STATEMENT_VARIANTS)
+    missing = [
+        label for label in STATEMENT_VARIANTS
+        if not located.get(label, {}).get('titled')
+        or located[label]['confidence'] < LOCATE_CONFIDENCE_THRESHOLD
+    ]
+    return not missing, missing
+
+
+def merge_analyze_results(*results):
+    # Merge partial layout results into one result with pages sorted by page number.
+    # A page analysed by more than one pass is taken, with its tables, from the first one.
+    pages = {}
+    tables = []
+    for result in results:
+        seen = set(pages)
+        for page in result.get('pages') or []:
+            pages.setdefault(page['page_number'], page)
+        for table in result.get('tables') or []:
+            regions = table.get('bounding_regions') or []
+            if not regions or regions[0]['page_number'] not in seen:
+                tables.append(table)
+    return {'pages': [pages[number] for number in sorted(pages)], 'tables': tables}
+
+
+def parse_report_pdf(document_analysis_client, pth, store_dir, two_pass=True, shard_pages=SHARD_PAGES):
+    # Analyse the report at pth and save its pages and tables in the report store at store_dir
+    result_dict = None
+    if two_pass:
+        # First pass: the leading pages only, to read the Contents page
+        report_progress("[Parse Annual Report] Reading the Contents page", 0.1)
+        contents_result = analyze_document(document_analysis_client, pth, pages=f"1-{CONTENTS_PAGES}")
+        content = []
+        for page in contents_result.get('pages') or []:
+            content.extend(line['content'] for line in page.get('lines') or [])
+        try:
+            statements_and_page_numbers = extract_statements_and_page_numbers(' '.join(content))
+        except (ValueError, SyntaxError):
+            statements_and_page_numbers = []
+        page_count = count_pdf_pages(pth)
+        pages = statement_page_ranges(statements_and_page_numbers, page_count=page_count)
+        if pages:
+            # Second pass: only the pages around the financial statements
+            report_progress(f"Analysing statement pages {pages}", 0.3)
+            statements_result = analyze_document(document_analysis_client, pth, pages=pages)
+            result_dict = merge_analyze_results(contents_result, statements_result)
+            # The printed numbers can be off by more than the margin: check the statements
+            # are on the stored pages, retry once with a wider margin, then analyse everything
+            found, missing = statements_located(result_dict, store_dir)
+            if not found:
+                wide_pages = statement_page_ranges(
+                    statements_and_page_numbers, margin=STATEMENT_PAGE_WIDE_MARGIN, page_count=page_count,
+                )
+                extra_pages = format_page_ranges(page_range_numbers(wide_pages) - page_range_numbers(pages))
+                if extra_pages:
+                    report_progress(f"Statements {', '.join(missing)} not found, analysing pages {extra_pages}", 0.4)
+                    extra_result = analyze_document(document_analysis_client, pth, pages=extra_pages)
+                    result_dict = merge_analyze_results(result_dict, extra_result)
+                    found, missing = statements_located(result_dict, store_dir)
+            if not found:
+                report_progress(f"Statements {', '.join(missing)} not found, analysing the full report", 0.5)
+                result_dict = None
+        else:
+            report_progress("Statements not found on the Contents page, analysing the full report", 0.3)
+    if result_dict is None and shard_pages:
+        report_progress("[Parse Annual Report] Analysing the report in shards", 0.3)
+        result_dict = analyze_sharded(
+            lambda pth, pages: analyze_document(document_analysis_client, pth, pages=pages),
+            pth, shard_pages=shard_pages,
+        )
+    if result_dict is None:
+        report_progress("[Parse Annual Report] Waiting for Document Intelligence", 0.1)
+        result_dict = analyze_document(document_analysis_client, pth)
+
+    # Save the pages and tables in the compact report store
+    report_progress("Saving the parsed report", 0.9)
+    save_report_store(result_dict, store_dir)
+    return result_dict
+
+
+def parse_annual_report(two_pass=True, shard_pages=SHARD_PAGES, data_dir=DATA_DIR):
+    # shard_pages: when the full report is analysed, split it into shards of this many pages
+    # analysed concurrently (None or 0 to send it in one request)
     # Initialize the Document Analysis Client
-    document_analysis_client = DocumentAnalysisClient(
-        endpoint=endpoint, credential=AzureKeyCredential(key)
-    )
+    document_analysis_client = get_document_analysis_client()
     
     # Load the path from the annual_report.json file
-    with open('data/annual_report.json', 'r', encoding='utf-8') as f:
+    json_path = os.path.join(data_dir, 'annual_report.json')
+    with open(json_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
         pth = data['results'][0]['path']
     
-    # Analyze the document
-    with open(pth, "rb") as f:
-        poller = document_analysis_client.begin_analyze_document(
-            "prebuilt-layout", document=f, locale="en-US",
-        )
-    result = poller.result()
-    
-    # Convert the result to a dictionary
-    result_dict = result.to_dict()
+    # Analyze the document and save the report store
+    store_path = os.path.join(data_dir, 'annual_report_store')
+    result_dict = parse_report_pdf(document_analysis_client, pth, store_path, two_pass, shard_pages)
     
-    # Save the result dictionary as a pickle file
-    pkl_path = 'data/annual_report.pkl'
-    with open(pkl_path, 'wb') as pkl_file:
-        pickle.dump(result_dict, pkl_file)
+    update_manifest('annual_report_store', store_path, data['date'], record_count=len(result_dict.get('pages') or []))
     
-    # Update the JSON file with the path to the pickle file
-    data['results'][0]['content'] = pkl_path
-    with open('data/annual_report.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    # Update the JSON file with the path to the report store, which no longer holds an earlier year
+    for entry in data['results'][1:]:
+        if entry.get('content') == store_path:
+            entry['content'] = None
+    data['results'][0]['content'] = store_path
+    write_json_artifact('annual_report', json_path, data)
     
     return result_dict
 
@@ -88,15 +235,14 @@ def extract_statements_and_page_numbers(merged_content):
         {"role": "user", "content": f"{merged_content}"},
     ]
 
-    response = openai.ChatCompletion.create(
-        engine=openai.engine,
+    response = chat_completion(
         messages=messages,
         temperature=0.1,
         max_tokens=1000,
         top_p=0.95,
         frequency_penalty=0,
         presence_penalty=0,
-    )["choices"][0]["message"]["content"]
+    )
 
 
     result = ast.literal_eval(response)
@@ -116,15 +262,14 @@ def fine_tune_page_indices(statements_and_page_numbers, page_idx_content):
         {"role": "user", "content": f"Drafted Statement: {statements_and_page_numbers} Content: {page_idx_content}"},
     ]
 
-    response = openai.ChatCompletion.create(
-        engine=openai.engine,
+    response = chat_completion(
         messages=messages,
         temperature=0.1,
         max_tokens=1000,
         top_p=0.95,
         frequency_penalty=0,
         presence_penalty=0,
-    )["choices"][0]["message"]["content"]
+    )
 
 
     # Regular expression to find all numbers in the text
@@ -144,106 +289,168 @@ def fine_tune_page_indices(statements_and_page_numbers, page_idx_content):
 
 
 # Function to find all pages and tables
-def findall_pages_idx_and_numbers(ar):
-    pages_idx_and_numbers = {}
-
-    for idx, page in enumerate(ar['pages']):
-        content = []
-        for line in page['lines']:
-            content.append(line['content'])
-        
-        content = ' '.join(content)
-        pages_idx_and_numbers[idx] = {"page_number": page['page_number'], "table_indices": []}
-    
-    for table_idx, table in enumerate(ar['tables']):
-        page_number = table['bounding_regions'][0]['page_number']
-        for idx, info in pages_idx_and_numbers.items():
-            if info["page_number"] == page_number:
-                info["table_indices"].append(table_idx)
+def findall_pages_idx_and_numbers(store):
+    # Precomputed at parse time by the report store, maps page_idx -> {page_number, table_indices}
+    return store.page_index["pages"]
+
+STATEMENT_LABELS = ['profit_or_loss', 'financial_position', 'changes_in_equity', 'cash_flow', 'comprehensive_income', 'na']
+
+# Known wordings of each statement, used for fuzzy matching
+STATEMENT_VARIANTS = {
+    'profit_or_loss': [
+        'statement of profit or loss', 'profit or loss statement', 'income statement',
+        'statement of profit and loss', 'profit and loss account', 'statement of income',
+    ],
+    'comprehensive_income': [
+        'statement of comprehensive income', 'comprehensive income statement', 'comprehensive income',
+        'statement of profit or loss and other comprehensive income',
+    ],
+    'financial_position': [
+        'statement of financial position', 'financial position statement', 'balance sheet',
+    ],
+    'changes_in_equity': [
+        'statement of changes in equity', 'changes in equity', 'statement of changes in shareholders equity',
+    ],
+    'cash_flow': [
+        'statement of cash flows', 'cash flow statement', 'statement of cash flow',
+    ],
+}
+
+# Keywords that identify a statement on their own
+STATEMENT_KEYWORDS = {
+    'profit_or_loss': [('profit', 'loss'), ('income', 'statement')],
+    'comprehensive_income': [('comprehensive',)],
+    'financial_position': [('financial', 'position'), ('balance', 'sheet')],
+    'changes_in_equity': [('changes', 'equity'), ('change', 'equity')],
+    'cash_flow': [('cash', 'flow'), ('cash', 'flows')],
+}
+
+STATEMENT_FILLER_WORDS = {'consolidated', 'group', 'company', 'the', 'for', 'year', 'ended'}
+STATEMENT_CONFIDENCE_THRESHOLD = 0.75
+
+
+def normalize_statement_name(statement_name):
+    words = re.findall(r'[a-z]+', statement_name.lower())
+    return ' '.join(word for word in words if word not in STATEMENT_FILLER_WORDS)
+
+
+def local_statement_classifier(statement_name):
+    # Keyword and fuzzy match against STATEMENT_VARIANTS, returns (label, confidence)
+    normalized = normalize_statement_name(statement_name)
+    words = set(normalized.split())
+
+    best_label, best_ratio = 'na', 0.0
+    for label, variants in STATEMENT_VARIANTS.items():
+        for variant in variants:
+            ratio = difflib.SequenceMatcher(None, normalized, variant).ratio()
+            if ratio > best_ratio:
+                best_label, best_ratio = label, ratio
+
+    keyword_labels = [
+        label for label, keyword_sets in STATEMENT_KEYWORDS.items()
+        if any(all(keyword in words for keyword in keywords) for keywords in keyword_sets)
+    ]
+    # A single unambiguous keyword match is trusted, several matches (e.g. a combined
+    # profit or loss and comprehensive income statement) are left to the fuzzy score
+    if len(keyword_labels) == 1:
+        if keyword_labels[0] == best_label:
+            return best_label, max(best_ratio, 0.9)
+        return keyword_labels[0], 0.8
+    return best_label, best_ratio
 
-    return pages_idx_and_numbers
 
 def statement_classifier(statement_name):
+    return classify_statements([statement_name])[statement_name]
+
+
+def classify_statements(statement_names):
+    # Classify locally, and send only the low-confidence names to the LLM in one request
+    labels = {}
+    uncertain = []
+    for statement_name in statement_names:
+        label, confidence = local_statement_classifier(statement_name)
+        if confidence >= STATEMENT_CONFIDENCE_THRESHOLD:
+            labels[statement_name] = label
+        elif statement_name not in uncertain:
+            uncertain.append(statement_name)
+    if uncertain:
+        labels.update(zip(uncertain, llm_statement_classifier(uncertain)))
+    return labels
+
+
+def llm_statement_classifier(statement_names):
 
     system_prompt = (
-        f"""You are trained to classify the statement name according to the below name.
+        f"""You are trained to classify each statement name in a list according to the below names.
             1. profit_or_loss
             2. financial_position
             3. changes_in_equity
             4. cash_flow
             5. comprehensive_income
             6. na
-            Only return either and only one: 'profit_or_loss', 'financial_position', 'changes_in_equity', 'cash_flow', 'comprehensive_incom', 'na' even none of them are matched.
+            For every statement name return either and only one of: 'profit_or_loss', 'financial_position', 'changes_in_equity', 'cash_flow', 'comprehensive_income', 'na' even none of them are matched.
+            The output format should be a list in the same order as the input: ['label 1', 'label 2', ... ]
         """ )
 
-
-    user_example = ("Consolidated Statement of Profit or Loss")
-    assistant_example = ("profit_or_loss")
-    user_example2 = ("Consolidated Statement of Comprehensive Income")
-    assistant_example2 = ("comprehensive_income")
-    user_example3 = ("Statement of Cash Flows")
-    assistant_example3 = ("cash_flow")
-    user_example4 = ("totaly wrong statement name")
-    assistant_example4 = ("na")
+    user_example = ["Consolidated Statement of Profit or Loss", "Statement of Cash Flows", "totaly wrong statement name"]
+    assistant_example = ["profit_or_loss", "cash_flow", "na"]
 
     messages = [
         {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_example},
-        {"role": "assistant", "content": assistant_example},
-        {"role": "user", "content": user_example2},
-        {"role": "assistant", "content": assistant_example2},
-        {"role": "user", "content": user_example3},
-        {"role": "assistant", "content": assistant_example3},
-        {"role": "user", "content": user_example4},
-        {"role": "assistant", "content": assistant_example4},
-        {"role": "user", "content": f"{statement_name}"},
+        {"role": "user", "content": json.dumps(user_example)},
+        {"role": "assistant", "content": json.dumps(assistant_example)},
+        {"role": "user", "content": json.dumps(statement_names)},
     ]
 
-    response = openai.ChatCompletion.create(
-        engine=openai.engine,
+    response = chat_completion(
         messages=messages,
         temperature=0,
         max_tokens=1000,
         top_p=0.95,
         frequency_penalty=0,
         presence_penalty=0,
-    )["choices"][0]["message"]["content"]
+    )
 
-    return response
+    try:
+        labels = ast.literal_eval(response)
+    except (ValueError, SyntaxError):
+        labels = []
+    labels = [label if label in STATEMENT_LABELS else 'na' for label in labels]
+    # Pad a short answer so every statement gets a label
+    return (labels + ['na'] * len(statement_names))[:len(statement_names)]
+
+
+def _markdown_cell(text):
+    return text.replace('|', '\\|').replace('\n', ' ')
 
 
 def build_markdown_table(table):
-    rows = []
-    max_cols = 0
-    cells = table.get('cells', [])
-    for row in range(table['row_count']):
-        current_row = []
-        for cell in cells:
-            if cell['row_index'] == row:
-                current_row.append(cell['content'])
-        rows.append(current_row)
-        max_cols = max(max_cols, len(current_row))
-    if rows:
-        column_names = rows.pop(0)
-    else:
-        column_names = []
-    while len(column_names) < max_cols:
-        column_names.append('')
-    for row in rows:
-        while len(row) < len(column_names):
-            row.append('')
-            
-    df = pd.DataFrame(rows, columns=column_names)
-    markdown_tb = tabulate(df, tablefmt="pipe", headers="keys")
-    
-    return markdown_tb
+    grid, header_count = assemble_table_grid(table)
+    if not grid:
+        return ''
+    column_count = len(grid[0])
+
+    header = stacked_header(grid, header_count)
+    lines = ['| ' + ' | '.join(_markdown_cell(text) for text in header) + ' |']
+    lines.append('|' + '---|' * column_count)
+    for row in grid[header_count:]:
+        lines.append('| ' + ' | '.join(_markdown_cell(text) for text in row) + ' |')
+    return '\n'.join(lines)
+
 
+def build_markdown_tables(tables):
+    # Render a batch of tables, one markdown table per entry
+    return [build_markdown_table(table) for table in tables]
 
-def find_statement_insights(content):
+
+def find_statement_insights(content, stream=False):
+    # With stream=True the insights are returned as a generator of text pieces
 
     system_prompt = (
         f"""You are the best AI financial analyst to analyse and find out the insight from the statements and figures. 
-        Please provide detailed insights based on each statement. Please provide the insight with figures and calculation support.
+        The figures, ratios and year-over-year changes were computed from the statements and are correct; use them as given and do not recalculate them.
+        Statements without computed figures are given as tables. If a line item is not reported, say so.
+        Please provide detailed insights based on each statement, quoting the figures that support them.
         Please provide your responses using the format specified below:
         [STATEMENT] CONSOLIDATED STATEMENT OF PROFIT OR LOSS
         [1] Profit before tax and interest expense: <insight & figures>
@@ -285,88 +492,168 @@ def find_statement_insights(content):
 
     messages = [
         {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Statements: {content}"},
+        {"role": "user", "content": f"Figures: {content}"},
     ]
 
-    response = openai.ChatCompletion.create(
-        engine=openai.engine,
+    completion = chat_completion_stream if stream else chat_completion
+    response = completion(
         messages=messages,
         temperature=0,
         max_tokens=2000,
         top_p=0.95,
         frequency_penalty=0,
         presence_penalty=0,
-    )["choices"][0]["message"]["content"]
+    )
 
     return response
 
 
-def analyse_annual_report():
-    with open("data/annual_report.pkl", 'rb') as pkl_file:
-        ar = pickle.load(pkl_file)
+def statement_table_indices(store, start_page_idx, end_page_idx):
+    # Table indices on the pages start_page_idx..end_page_idx (page indices of the store)
+    pages_idx_and_numbers = findall_pages_idx_and_numbers(store)
+    table_indices = []
+    for page_idx in range(start_page_idx, end_page_idx + 1):
+        page_info = pages_idx_and_numbers.get(page_idx)
+        if page_info:
+            table_indices.extend(idx for idx in page_info['table_indices'] if idx not in table_indices)
+    return table_indices
 
+
+def locate_statements_from_contents(store):
+    # {label: table indices} from the Contents page: the LLM reads the statements and their
+    # printed page numbers, which are then classified and mapped to the stored pages
     content = []
-    for idx in range(5):
-        page = ar['pages'][idx]
-        for line in page['lines']:
-            content.append(line['content'])
+    for idx in range(min(CONTENTS_PAGES, store.page_count)):
+        content.extend(store.page_lines(idx))
     merged_content = ' '.join(content)
-
     statements_and_page_numbers = extract_statements_and_page_numbers(merged_content)
+    print(statements_and_page_numbers)
 
-    for statement in statements_and_page_numbers:
-        statement.append(statement[1])
-    adjusted_statements_and_page_indices = statements_and_page_numbers
-    print(adjusted_statements_and_page_indices)
-    
-    # # Adjust the Statement and Page Indices
-    # min_search_page = int(statements_and_page_numbers[0][1]) - 5
-    # max_search_page = int(statements_and_page_numbers[-1][1]) + 5
-    # search_pages_idx = (min_search_page, max_search_page)
-
-    # statement_names = []
-    # for data in statements_and_page_numbers:
-    #     statement_names.append(data[0])
-
-    # page_idx_content = {}
-    # for idx in list(range(min_search_page, max_search_page + 1)):
-    #     page_content = []
-    #     for line in ar['pages'][idx]['lines']:
-    #         page_content.append(line['content'])
-    #     page_idx_content[idx] = ' '.join(page_content)
-
-    # adjusted_statements_and_page_indices = fine_tune_page_indices(statements_and_page_numbers, page_idx_content)
-    # print(adjusted_statements_and_page_indices)
-
-    # Get Statement Name and Table Indices
-    pages_idx_and_numbers = findall_pages_idx_and_numbers(ar)
+    with metrics.span('classify_statements'):
+        statement_labels = classify_statements([statement[0] for statement in statements_and_page_numbers])
     fs_idx = {}
-    for statement in adjusted_statements_and_page_indices:
-        statement_name = statement[0]
-        start_page_idx = int(statement[1])
-        end_page_idx = int(statement[2])
-        adjusted_statement_name = statement_classifier(statement_name)
-
-        # Initialize empty list for table indices
-        table_indices = []
-
-        # Loop through page indices from start_page_idx to end_page_idx inclusive
-        for page_idx in range(start_page_idx, end_page_idx + 1):
-            table_indices.extend(pages_idx_and_numbers[page_idx]['table_indices'])  
-
-        fs_idx[adjusted_statement_name] = table_indices
+    for statement in statements_and_page_numbers:
+        # A two-pass parse only stores some pages, so go through the page number (index + 1)
+        try:
+            page_idx = store.page_idx(int(statement[1]) + 1)
+        except (ValueError, TypeError):
+            page_idx = None  # No usable page number, e.g. "N/A"
+        table_indices = statement_table_indices(store, page_idx, page_idx) if page_idx is not None else []
+        fs_idx[statement_labels[statement[0]]] = table_indices
+    return fs_idx
+
+
+def locate_statement_tables(store):
+    # {statement label: table indices} of the financial statements in a report store.
+    # The local page index finds the statements; only those it cannot place with
+    # confidence go through the Contents page and the LLM.
+    with metrics.span('locate_statements') as span:
+        located = locate_statements(store, STATEMENT_VARIANTS)
+        located = {
+            label: entry for label, entry in sorted(located.items(), key=lambda item: item[1]['start'])
+            if entry['confidence'] >= LOCATE_CONFIDENCE_THRESHOLD
+        }
+        span['located'] = {label: [entry['start'], entry['end']] for label, entry in located.items()}
+        fs_idx = {
+            label: statement_table_indices(store, entry['start'], entry['end'])
+            for label, entry in located.items()
+        }
+        span['fallback'] = len(located) < len(STATEMENT_VARIANTS)
+        if span['fallback']:
+            for label, table_indices in locate_statements_from_contents(store).items():
+                fs_idx.setdefault(label, table_indices)
     print(fs_idx)
-
-    content = []
-    for fs, idx_list in fs_idx.items():    
-        content.append(fs)
-        markdown_tb = ''
-        for idx in idx_list:
-            markdown_tb_partial = '\n ' + build_markdown_table(ar['tables'][idx])
-            markdown_tb += markdown_tb_partial
-        content.append(markdown_tb)
-    content = ' '.join(content)
-    result = find_statement_insights(content)
+    return fs_idx
+
+
+def extract_report_facts(store, fs_idx):
+    # Computed statement figures of a report store, see script/statement_facts.py
+    from script.statement_facts import statement_facts  # pandas is only loaded when a report is analysed
+    with metrics.span('extract_facts') as span:
+        facts, unit = statement_facts({
+            label: [store.table(idx) for idx in idx_list] for label, idx_list in fs_idx.items() if label != 'na'
+        })
+        span['line_items'] = int(facts['items'].notna().any(axis=1).sum())
+    return facts, unit
+
+
+def save_report_facts(data_dir, facts, unit):
+    # Add the analysed report's figures to the multi-year fact store, if the report
+    # store holds the latest fetched report (annual_report.json names its year)
+    from script.fact_store import write_partition
+    try:
+        with open(os.path.join(data_dir, 'annual_report.json'), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return
+    latest = data['results'][0]
+    if 'year' in latest and latest.get('content') == os.path.join(data_dir, 'annual_report_store'):
+        write_partition(data.get('company') or get_company()['id'], latest['year'], facts, unit)
+
+
+def update_fact_store(company=None, data_dir=DATA_DIR, two_pass=True, shard_pages=SHARD_PAGES):
+    # Parse every fetched report without a fact store partition, once, and add its figures.
+    # Earlier years are parsed into annual_report_stores/<year>; the latest report reuses
+    # annual_report_store when it has been parsed already.
+    from script.fact_store import has_partition, write_partition, stored_years, partition_path
+    company = company or get_company()
+    json_path = os.path.join(data_dir, 'annual_report.json')
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    missing = [entry for entry in data['results'] if 'year' in entry and not has_partition(company['id'], entry['year'])]
+
+    document_analysis_client = None
+    for count, entry in enumerate(missing):
+        year = entry['year']
+        report_progress(f"[Multi-Year Facts] Reading the {year} report ({count + 1}/{len(missing)})", count / len(missing))
+        store_dir = entry.get('content') or os.path.join(data_dir, 'annual_report_stores', str(year))
+        try:
+            if not os.path.exists(os.path.join(store_dir, 'meta.json')):
+                document_analysis_client = document_analysis_client or get_document_analysis_client()
+                parse_report_pdf(document_analysis_client, entry['path'], store_dir, two_pass, shard_pages)
+            store = load_report_store(store_dir)
+            facts, unit = extract_report_facts(store, locate_statement_tables(store))
+        except Exception as e:
+            # One unreadable report does not stop the other years
+            print(f"Error reading the {year} report: {e}")
+            report_progress(f"Error reading the {year} report: {e}")
+            continue
+        path, rows = write_partition(company['id'], year, facts, unit)
+        report_progress(f"Saved {rows} figures of the {year} report in '{path}'.")
+
+    years = stored_years(company['id'])
+    write_json_artifact('fact_store', os.path.join(data_dir, 'fact_store.json'), {
+        "date": time.strftime('%Y%m%d'),
+        "company": company['id'],
+        "results": [{"year": year, "path": partition_path(company['id'], year)} for year in sorted(years, reverse=True)],
+    })
+    report_progress(f"The fact store holds {len(years)} years of figures.", 1.0)
+    return years
+
+
+def analyse_annual_report(stream=False, data_dir=DATA_DIR):
+    store = load_report_store(os.path.join(data_dir, 'annual_report_store'))
+
+    report_progress("[Analyse Annual Report] Locating the financial statements", 0.1)
+    fs_idx = locate_statement_tables(store)
+    report_progress("Extracting the statement figures", 0.4)
+
+    # Line items, ratios and year-over-year changes are computed locally and the LLM
+    # comments on them; a statement none of whose line items is found is sent as tables
+    from script.statement_facts import format_facts, unparsed_statements  # pandas, loaded on first use
+    facts, unit = extract_report_facts(store, fs_idx)
+    content = [format_facts(facts, unit)]
+    save_report_facts(data_dir, facts, unit)
+    unparsed = unparsed_statements(facts, fs_idx)
+    with metrics.span('render_tables') as span:
+        for fs in unparsed:
+            content.append(fs)
+            markdown_tbs = build_markdown_tables(store.table(idx) for idx in fs_idx[fs])
+            content.append(''.join('\n ' + markdown_tb for markdown_tb in markdown_tbs))
+        content = ' '.join(content)
+        span['tables'] = sum(len(fs_idx[fs]) for fs in unparsed)
+    report_progress("Generating the insights", 0.5)
+    result = find_statement_insights(content, stream=stream)
     
     return result
 
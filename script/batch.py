@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from script.companies import REGISTRY_PATH, load_companies, company_data_dir
+from script.fetch_data import homepage_check, news_search, fetch_report
+from script.annual_report_insight import parse_annual_report, analyse_annual_report, update_fact_store
+from script.company_bg_insight import find_company_bg_insights
+from script.limits import set_limit
+from script.manifest import atomic_write
+
+# Batch runner: fetch -> parse -> analyse for every company in the registry.
+# Companies run concurrently; the calls to each upstream API are bounded by
+# script/limits.py. Finished stages are recorded per company in batch_state.json,
+# so rerunning the same run id resumes where a failure stopped it.
+STATE_NAME = 'batch_state.json'
+
+
+def _homepage(company, data_dir):
+    for _ in homepage_check(company, data_dir):
+        pass
+
+
+def _write_text(path, text):
+    atomic_write(path, text.encode('utf-8'))
+
+
+# (stage, function, artifact that must exist afterwards)
+STAGES = [
+    ('homepage', _homepage, 'homepage_data.json'),
+    ('news', lambda company, data_dir: news_search(company, data_dir), 'news_data.jsonl'),
+    ('fetch_report', lambda company, data_dir: fetch_report(company, data_dir), 'annual_report.json'),
+    ('parse_report', lambda company, data_dir: parse_annual_report(data_dir=data_dir), 'annual_report_store'),
+    ('analyse_report', lambda company, data_dir: _write_text(
+        os.path.join(data_dir, 'annual_report_insights.md'), analyse_annual_report(data_dir=data_dir),
+    ), 'annual_report_insights.md'),
+    ('fact_store', lambda company, data_dir: update_fact_store(company, data_dir), 'fact_store.json'),
+    ('company_overview', lambda company, data_dir: _write_text(
+        os.path.join(data_dir, 'company_overview.md'), find_company_bg_insights(data_dir=data_dir),
+    ), 'company_overview.md'),
+]
+
+
+def load_state(data_dir, run_id):
+    try:
+        with open(os.path.join(data_dir, STATE_NAME), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+    if state.get('run_id') != run_id:
+        state = {'run_id': run_id, 'stages': {}}
+    return state
+
+
+def save_state(data_dir, state):
+    atomic_write(os.path.join(data_dir, STATE_NAME), json.dumps(state, indent=4).encode('utf-8'))
+
+
+def run_company(company, run_id, force=False):
+    # Run the missing stages of one company, stop at the first failure
+    data_dir = company_data_dir(company['id'])
+    os.makedirs(data_dir, exist_ok=True)
+    state = load_state(data_dir, run_id)
+    for stage, func, artifact in STAGES:
+        if not force and state['stages'].get(stage, {}).get('status') == 'done':
+            continue
+        started_at = time.time()
+        try:
+            func(company, data_dir)
+            # Stages print their errors instead of raising, so check the artifact was rewritten
+            artifact_path = os.path.join(data_dir, artifact)
+            if not os.path.exists(artifact_path) or os.path.getmtime(artifact_path) < started_at - 1:
+                raise RuntimeError(f"{stage} did not produce {artifact}")
+            state['stages'][stage] = {'status': 'done', 'seconds': round(time.time() - started_at, 3)}
+        except Exception as e:
+            state['stages'][stage] = {'status': 'failed', 'error': str(e), 'traceback': traceback.format_exc()}
+            save_state(data_dir, state)
+            return company['id'], stage, e
+        save_state(data_dir, state)
+    return company['id'], None, None
+
+
+def run_batch(companies, run_id, workers=4, force=False):
+    failures = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_company, company, run_id, force) for company in companies]
+        for future in as_completed(futures):
+            company_id, stage, error = future.result()
+            if error is None:
+                print(f"[{company_id}] done")
+            else:
+                failures[company_id] = (stage, error)
+                print(f"[{company_id}] failed at {stage}: {error}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the company insight pipeline over the company registry.")
+    parser.add_argument('--registry', default=REGISTRY_PATH, help="company registry JSON file")
+    parser.add_argument('--companies', nargs='*', help="company ids to run (default: all)")
+    parser.add_argument('--run-id', default=datetime.now().strftime('%Y%m%d'),
+                        help="stages finished under the same run id are not repeated (default: today)")
+    parser.add_argument('--workers', type=int, default=4, help="companies processed concurrently")
+    parser.add_argument('--news-limit', type=int, help="concurrent News API requests")
+    parser.add_argument('--di-limit', type=int, help="concurrent Document Intelligence analyses")
+    parser.add_argument('--openai-limit', type=int, help="concurrent OpenAI requests")
+    parser.add_argument('--force', action='store_true', help="rerun stages that are already done")
+    args = parser.parse_args(argv)
+
+    for name, limit in (('news_api', args.news_limit), ('document_intelligence', args.di_limit), ('openai', args.openai_limit)):
+        if limit:
+            set_limit(name, limit)
+
+    companies = load_companies(args.registry)
+    if args.companies:
+        companies = [company for company in companies if company['id'] in args.companies]
+    failures = run_batch(companies, args.run_id, args.workers, args.force)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,26 @@
+import json
+import os
+
+# Registry of the companies the pipeline runs on. The default company keeps its
+# artifacts directly under data/, every other company under data/companies/<id>/.
+REGISTRY_PATH = 'companies.json'
+DEFAULT_COMPANY_ID = 'mtr'
+DATA_DIR = 'data'
+
+
+def load_companies(path=REGISTRY_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['companies']
+
+
+def get_company(company_id=DEFAULT_COMPANY_ID, path=REGISTRY_PATH):
+    for company in load_companies(path):
+        if company['id'] == company_id:
+            return company
+    raise KeyError(f"Company '{company_id}' not found in {path}")
+
+
+def company_data_dir(company_id):
+    if company_id == DEFAULT_COMPANY_ID:
+        return DATA_DIR
+    return os.path.join(DATA_DIR, 'companies', company_id)
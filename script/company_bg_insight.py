@@ -1,55 +1,121 @@
 import os
-import json
-from dotenv import load_dotenv
-import openai
+from concurrent.futures import ThreadPoolExecutor
+from script.manifest import load_json
+from script import news_store
+from script.companies import DATA_DIR
+from script.jobs import report_progress
+from script.llm import chat_completion, chat_completion_stream, count_tokens
 
 
 
-# Load environment variables from .env file
-load_dotenv()
-openai.api_key = os.getenv('AZURE_GPT_API_KEY')
-openai.api_base = os.getenv('AZURE_GPT_API_BASE')
-openai.api_version = os.getenv('AZURE_GPT_API_VERSION')
-openai.api_type = os.getenv('AZURE_GPT_API_TYPE')
-openai.engine = os.getenv('AZURE_GPT_ENGINE')
+# Map-reduce settings: token budget per prompt chunk and concurrent summary requests
+CHUNK_TOKEN_BUDGET = 6000
+MAX_WORKERS = 4
+# Summary length: at most this many tokens and half the chunk budget, so two summaries fit a chunk
+SUMMARY_MAX_TOKENS = 800
 
+SYSTEM_PROMPT = (
+    """You are the best AI analyst to analyze and find out the insights from the statements and figures. 
+    Please summarize and find out the insights from the content, and generate the company overview.
+    Please respond as few short paragraph.
+    """
+)
 
+CHUNK_SYSTEM_PROMPT = (
+    """You are the best AI analyst to analyze and find out the insights from the statements and figures. 
+    The content is one part of the news articles and homepage extracts about a company.
+    Please summarize the key facts, figures and events in the content as short bullet points.
+    """
+)
 
-def find_company_bg_insights():
-    # Load and concatenate JSON files
-    with open('data/news_data.json', 'r') as file:
-        news_data = json.load(file)
-    with open('data/homepage_data.json', 'r') as file:
-        homepage_data = json.load(file)
-    homepage_data = homepage_data['results'][:10]
-    
-    # Convert JSON objects to strings
-    news_data_str = json.dumps(news_data)
-    homepage_data_str = json.dumps(homepage_data)
-
-    # Concatenate the strings
-    content = news_data_str + homepage_data_str
-        
-    system_prompt = (
-        """You are the best AI analyst to analyze and find out the insights from the statements and figures. 
-        Please summarize and find out the insights from the content, and generate the company overview.
-        Please respond as few short paragraph.
-        """
-    )
 
+def compact_records(news_data, homepage_data):
+    # Keep only the fields that carry information, one line of text per record
+    records = []
+    for article in news_data.get('results', []):
+        fields = [article.get('publishedAt'), article.get('source'), article.get('title'), article.get('description')]
+        if article.get('duplicate_count', 1) > 1:
+            fields.append(f"reported by {article['duplicate_count']} articles")
+        records.append(' | '.join(str(field) for field in fields if field))
+    for page in homepage_data:
+        records.append(f"{page.get('link')} | {page.get('content') or ''}")
+    return records
+
+
+def truncate_to_budget(text, budget):
+    # Cut a single oversized record down until it fits in the budget
+    while count_tokens(text) > budget:
+        text = text[:int(len(text) * budget / count_tokens(text) * 0.95)]
+    return text
+
+
+def pack_chunks(records, budget=None):
+    # Greedily pack records into chunks of at most budget tokens
+    budget = budget or CHUNK_TOKEN_BUDGET
+    chunks = []
+    current, current_tokens = [], 0
+    for record in records:
+        record = truncate_to_budget(record, budget)
+        tokens = count_tokens(record) + 1
+        if current and current_tokens + tokens > budget:
+            chunks.append('\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(record)
+        current_tokens += tokens
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+
+def summarize_chunk(chunk, system_prompt=CHUNK_SYSTEM_PROMPT, max_tokens=800, stream=False):
     messages = [
         {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Statements: {content}"},
+        {"role": "user", "content": f"Statements: {chunk}"},
     ]
-
-    insights = openai.ChatCompletion.create(
-        engine=openai.engine, 
+    completion = chat_completion_stream if stream else chat_completion
+    return completion(
         messages=messages,
         temperature=0,
-        max_tokens=2000,
+        max_tokens=max_tokens,
         top_p=0.95,
         frequency_penalty=0,
         presence_penalty=0,
-    )["choices"][0]["message"]["content"]
+    )
+
+
+def reduce_summaries(records, budget=None):
+    # Summarize chunks concurrently until everything fits in a single prompt
+    budget = budget or CHUNK_TOKEN_BUDGET
+    max_tokens = max(min(SUMMARY_MAX_TOKENS, budget // 2), 1)
+    chunks = pack_chunks(records, budget)
+    while len(chunks) > 1:
+        report_progress(f"Summarizing {len(chunks)} chunks")
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            summaries = list(executor.map(lambda chunk: summarize_chunk(chunk, max_tokens=max_tokens), chunks))
+        reduced = pack_chunks(summaries, budget)
+        if len(reduced) >= len(chunks):
+            # The summaries no longer shrink, cut the joined summaries down to the budget
+            return truncate_to_budget('\n'.join(summaries), budget)
+        chunks = reduced
+    return chunks[0] if chunks else ''
+
+
+def find_company_bg_insights(token_budget=None, stream=False, data_dir=DATA_DIR):
+    # With stream=True the overview is returned as a generator of text pieces
+    # Load the JSON files
+    articles = news_store.read_articles(data_dir)
+    # One article per story: syndicated copies and rewrites only add a count
+    from script.news_dedupe import dedupe_articles  # NumPy is only loaded when news is summarized
+    stories = dedupe_articles(articles)
+    report_progress(f"{len(articles)} news articles, {len(stories)} distinct stories", 0.1)
+    news_data = {'results': stories}
+    homepage_data = load_json(os.path.join(data_dir, 'homepage_data.json'))
+    homepage_data = homepage_data['results'][:10]
+
+    # Strip the payload to useful fields and reduce it to one prompt-sized chunk
+    content = reduce_summaries(compact_records(news_data, homepage_data), token_budget)
+
+    report_progress("Generating the company overview", 0.5)
+    insights = summarize_chunk(content, system_prompt=SYSTEM_PROMPT, max_tokens=2000, stream=stream)
 
     return insights
@@ -0,0 +1,51 @@
+import os
+import threading
+
+# One-time configuration shared by every module in script/ and app.py.
+# .env is read on first use instead of at import time, and the openai module is
+# imported and configured by the first call that needs it, so that importing the
+# pipeline modules stays cheap.
+_lock = threading.Lock()
+_settings = None
+_openai_configured = False
+
+
+class Settings:
+    def __init__(self, env):
+        self.gpt_api_key = env.get('AZURE_GPT_API_KEY')
+        self.gpt_api_base = env.get('AZURE_GPT_API_BASE')
+        self.gpt_api_version = env.get('AZURE_GPT_API_VERSION')
+        self.gpt_api_type = env.get('AZURE_GPT_API_TYPE')
+        self.gpt_engine = env.get('AZURE_GPT_ENGINE')
+        self.di_api_key = env.get('AZURE_DI_API_KEY')
+        self.di_endpoint = env.get('AZURE_DI_ENDPOINT')
+        self.news_api_key = env.get('NEWS_API_KEY')
+        self.news_api_url = env.get('NEWS_API_URL', 'https://newsapi.org/v2/everything')
+
+
+def get_settings():
+    # Load environment variables from the .env file once, on first use
+    global _settings
+    with _lock:
+        if _settings is None:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _settings = Settings(os.environ)
+    return _settings
+
+
+def get_openai():
+    # The openai module, configured for Azure from the settings on first use
+    global _openai_configured
+    settings = get_settings()
+    with _lock:
+        import openai
+        if not _openai_configured:
+            openai.api_key = settings.gpt_api_key
+            openai.api_base = settings.gpt_api_base
+            openai.api_version = settings.gpt_api_version
+            openai.api_type = settings.gpt_api_type
+            openai.engine = settings.gpt_engine
+            _openai_configured = True
+    return openai
+
@@ -0,0 +1,89 @@
+import mmap
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Sharded Document Intelligence parsing: the PDF is analysed as page-range shards
+# submitted concurrently (through the service's pages parameter), then the shard
+# results are stitched back into one result shaped like a single full analysis.
+SHARD_PAGES = 40
+MAX_CONCURRENT_SHARDS = 4
+
+_PAGE_COUNT_PATTERN = re.compile(rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b', re.S)
+
+
+def count_pdf_pages(pth):
+    # Number of pages in the PDF, or None if it cannot be told
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PyPdfError
+    except ImportError:  # In requirements.txt; without it the page tree is read directly
+        PdfReader = None
+    if PdfReader is not None:
+        try:
+            return len(PdfReader(pth).pages)
+        except (PyPdfError, ValueError, KeyError):
+            return None
+    with open(pth, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        # The root of the page tree has the largest /Count. Object streams can hide it and an
+        # incremental update (a second cross-reference section) can leave a stale one behind,
+        # so neither is trusted.
+        if data.find(b'/ObjStm') != -1 or data.find(b'startxref') != data.rfind(b'startxref'):
+            return None
+        counts = [int(a or b) for a, b in _PAGE_COUNT_PATTERN.findall(data)]
+    return max(counts) if counts else None
+
+
+def shard_ranges(page_count, shard_pages=SHARD_PAGES):
+    # [(first_page, last_page), ...] covering 1..page_count
+    return [
+        (first, min(first + shard_pages - 1, page_count))
+        for first in range(1, page_count + 1, shard_pages)
+    ]
+
+
+def _remap(node, span_offset, page_offset):
+    # Shift every span offset and page number in a result dict, in place
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'spans' and isinstance(value, list):
+                for span in value:
+                    span['offset'] += span_offset
+            elif key == 'page_number' and isinstance(value, int):
+                node[key] = value + page_offset
+            else:
+                _remap(value, span_offset, page_offset)
+    elif isinstance(node, list):
+        for item in node:
+            _remap(item, span_offset, page_offset)
+
+
+def merge_shard_results(shard_results):
+    # Stitch [(first_page, result_dict), ...] into one result dict.
+    # Each shard's content is appended to the merged content, so its spans move by the
+    # length of what precedes it; shards numbered from 1 are moved to their first page.
+    merged = {'content': '', 'pages': [], 'tables': [], 'paragraphs': []}
+    for first_page, result in sorted(shard_results, key=lambda item: item[0]):
+        pages = result.get('pages') or []
+        page_offset = first_page - pages[0]['page_number'] if pages else 0
+        span_offset = len(merged['content']) + (1 if merged['content'] else 0)
+        _remap(result, span_offset, page_offset)
+        if result.get('content'):
+            merged['content'] = merged['content'] + '\n' + result['content'] if merged['content'] else result['content']
+        for key in ('pages', 'tables', 'paragraphs'):
+            merged[key].extend(result.get(key) or [])
+    return merged
+
+
+def analyze_sharded(analyze, pth, shard_pages=SHARD_PAGES, max_workers=MAX_CONCURRENT_SHARDS):
+    # analyze(pth, pages) runs one layout analysis; returns None when the PDF cannot be sharded
+    page_count = count_pdf_pages(pth)
+    if not page_count or page_count <= shard_pages:
+        return None
+    ranges = shard_ranges(page_count, shard_pages)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda r: analyze(pth, f"{r[0]}-{r[1]}"), ranges)
+        merged = merge_shard_results([(first, result) for (first, _), result in zip(ranges, results)])
+    # The shards must hold every page exactly once, otherwise the page count was wrong
+    if [page['page_number'] for page in merged['pages']] != list(range(1, page_count + 1)):
+        return None
+    return merged
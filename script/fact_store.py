@@ -0,0 +1,100 @@
+import os
+import pandas as pd
+import pyarrow as pa
+from script.companies import DATA_DIR
+
+# Multi-year store of the computed statement figures (script/statement_facts.py), in
+# Parquet partitioned by company and report year:
+#   fact_store/company=<id>/year=<report year>/facts.parquet
+# Each partition holds one row per (kind, key, fiscal_year): a report carries its own
+# year and the comparative year. A new report only writes its own partition, and trend
+# queries read a few columns of the partitions instead of re-running the document analysis.
+FACT_STORE_DIR = os.path.join(DATA_DIR, 'fact_store')
+PARTITION_FILE = 'facts.parquet'
+COLUMNS = ['kind', 'key', 'fiscal_year', 'value', 'unit']
+# Explicit Parquet types: inferred from an empty partition, the text columns would be
+# typed null and every later read of the company's partitions would fail
+SCHEMA = pa.schema([
+    ('kind', pa.string()), ('key', pa.string()), ('fiscal_year', pa.int64()), ('value', pa.float64()), ('unit', pa.string()),
+])
+KINDS = {'items': 'item', 'amounts': 'amount', 'ratios': 'ratio'}
+
+
+def company_dir(company_id, root=FACT_STORE_DIR):
+    return os.path.join(root, f'company={company_id}')
+
+
+def partition_path(company_id, year, root=FACT_STORE_DIR):
+    return os.path.join(company_dir(company_id, root), f'year={int(year)}', PARTITION_FILE)
+
+
+def has_partition(company_id, year, root=FACT_STORE_DIR):
+    return os.path.exists(partition_path(company_id, year, root))
+
+
+def stored_years(company_id, root=FACT_STORE_DIR):
+    # Report years with a partition, from the directory names only
+    try:
+        names = os.listdir(company_dir(company_id, root))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[len('year='):]) for name in names
+                  if name.startswith('year=') and has_partition(company_id, name[len('year='):], root))
+
+
+def facts_frame(facts, unit):
+    # Long frame with COLUMNS from statement_facts() output, reported figures only
+    parts = []
+    for name, kind in KINDS.items():
+        frame = facts[name]
+        if not len(frame.columns):
+            continue
+        long = frame.rename_axis('key').reset_index().melt(id_vars='key', var_name='fiscal_year', value_name='value')
+        long['kind'] = kind
+        long['unit'] = 'ratio' if kind == 'ratio' else unit
+        parts.append(long.dropna(subset=['value']))
+    if not parts:
+        return pd.DataFrame({column: pd.Series(dtype=float if column == 'value' else object) for column in COLUMNS})
+    frame = pd.concat(parts, ignore_index=True)[COLUMNS]
+    return frame.astype({'fiscal_year': 'int64', 'value': 'float64'})
+
+
+def write_partition(company_id, year, facts, unit, root=FACT_STORE_DIR):
+    # Write (or replace) the partition of one report; other partitions are not touched.
+    # The temporary file starts with '.', so readers skip it until the rename.
+    path = partition_path(company_id, year, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(path), f'.{PARTITION_FILE}.{os.getpid()}.tmp')
+    frame = facts_frame(facts, unit)
+    frame.to_parquet(tmp_path, engine='pyarrow', index=False, schema=SCHEMA)
+    os.replace(tmp_path, path)
+    return path, len(frame)
+
+
+def read_facts(company_id, keys=None, columns=('year', 'key', 'fiscal_year', 'value'), root=FACT_STORE_DIR):
+    # Rows of a company's partitions, only the given columns and keys are read;
+    # 'year' is the report year from the partition directory
+    if not stored_years(company_id, root):
+        return pd.DataFrame(columns=list(columns))
+    filters = [('key', 'in', list(keys))] if keys else None
+    frame = pd.read_parquet(company_dir(company_id, root), engine='pyarrow', columns=list(columns), filters=filters)
+    if 'year' in frame.columns:
+        frame['year'] = frame['year'].astype('int64')
+    return frame
+
+
+def available_keys(company_id, root=FACT_STORE_DIR):
+    # {kind: [keys]} with figures in the store
+    frame = read_facts(company_id, columns=('kind', 'key'), root=root).drop_duplicates()
+    return {kind: sorted(group['key']) for kind, group in frame.groupby('kind')}
+
+
+def read_trend(company_id, keys, root=FACT_STORE_DIR):
+    # Frame of keys (columns) by fiscal year (index). A year reported again as the
+    # comparative of a later report takes the later, possibly restated, figure.
+    facts = read_facts(company_id, keys, root=root)
+    if facts.empty:
+        return pd.DataFrame(columns=list(keys), dtype=float)
+    latest = facts.sort_values('year').drop_duplicates(['fiscal_year', 'key'], keep='last')
+    trend = latest.pivot(index='fiscal_year', columns='key', values='value').sort_index()
+    return trend.reindex(columns=[key for key in keys if key in trend.columns])
@@ -1,60 +1,122 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import json
 import os
-from datetime import datetime
-from dotenv import load_dotenv
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+from script import html_extract, http_cache, metrics, news_store
+from script.llm import count_tokens
+from script.manifest import update_manifest, write_json_artifact
+from script.jobs import report_progress
+from script.companies import get_company, DATA_DIR
+from script.limits import call_api, CircuitOpenError, RETRYABLE_STATUS
+from script.config import get_settings
 
-# Load environment variables from .env file
-load_dotenv()
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://www.google.com/'
+}
 
+# Fetch engine settings: worker threads, pooled connections per host and (connect, read) timeouts
+MAX_WORKERS = 8
+MAX_CONNECTIONS_PER_HOST = 4
+REQUEST_TIMEOUT = (5, 30)
 
+_session = None
+_session_lock = threading.Lock()
 
-def fetch_content(url):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Referer': 'https://www.google.com/'
-    }
+
+def get_session():
+    # Shared session so that pages on the same host reuse TCP/TLS connections.
+    # pool_block caps the number of concurrent connections opened to a single host.
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(
+                pool_connections=MAX_WORKERS,
+                pool_maxsize=MAX_CONNECTIONS_PER_HOST,
+                pool_block=True,
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def web_endpoint(url):
+    # Rate limits and circuit breakers for web pages are kept per host
+    return 'web:' + urlsplit(url).netloc
+
+
+def fetch_page(url):
+    # Return (text blocks, whole-document text, cache_hit), or (None, None, False) on errors
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # Check if the request was successful
-        soup = BeautifulSoup(response.content, 'html.parser')
-        # Extract the main content from the page
-        content = soup.get_text(separator=' ', strip=True)
-        return content
-    except requests.RequestException as e:
+        # Conditional request through the on-disk cache, raises on HTTP errors
+        with metrics.span('fetch', url=url) as span:
+            body, cache_hit = call_api(web_endpoint(url), http_cache.cached_get, get_session(), url, timeout=REQUEST_TIMEOUT)
+            span.update(bytes=len(body), cache_hit=cache_hit)
+    except (requests.RequestException, CircuitOpenError) as e:
         print(f"Error fetching {url}: {e}")
-        return None
+        return None, None, False
+    # Extract the main content from the page, without scripts, navigation, headers and footers
+    with metrics.span('extract', engine=html_extract.DEFAULT_ENGINE):
+        blocks, raw_text = html_extract.extract_page(body)
+    return blocks, raw_text, cache_hit
 
-def homepage_check():
-    links = [
-        # Our company
-        "https://www.mtr.com.hk/purpose-vision-values/en/index.html",
-        "https://www.mtr.com.hk/en/corporate/consultancy/our-attributes.html",
-        "https://www.mtr.com.hk/en/corporate/overview/profile_index.html",
-        # Corporate responsibility
-        "https://www.mtr.com.hk/en/corporate/sustainability/our_approach.html",
-        "https://www.mtr.com.hk/sustainability/en/home.html",
-        "https://www.mtr.com.hk/en/corporate/sustainability/policy_statement.html",
-        "https://www.mtr.com.hk/en/corporate/sustainability/community_connect.html",
-        "https://www.mtr.com.hk/en/corporate/sustainability/operating_responsibly.html",
-        "https://www.mtr.com.hk/en/corporate/sustainability/sustainability_reporting.html"
-    ]
 
-    results = []
+def fetch_content(url, with_cache_status=False):
+    blocks, _, cache_hit = fetch_page(url)
+    content = ' '.join(blocks) if blocks is not None else None
+    if with_cache_status:
+        return content, cache_hit
+    return content
+
+def homepage_check(company=None, data_dir=DATA_DIR):
+    # company: an entry of companies.json, the default company when None
+    company = company or get_company()
+    links = company['homepage_links']
+
+    pages = {}
     progress_messages = []
     total_links = len(links)
-    progress_messages.append("[MTR Homepage Search]")
-    for idx, link in enumerate(links):
-        content = fetch_content(link)
-        if content:
-            results.append({'link': link, 'content': content})
-            progress_messages.append(f"[{idx + 1}] {link} Extracted!")
-            progress_percentage = (idx + 1) / total_links
+    progress_messages.append(f"[{company['name']} Homepage Search]")
+
+    # Fetch all pages concurrently and report each one as soon as it finishes
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, total_links)) as executor:
+        futures = {executor.submit(fetch_page, link): idx for idx, link in enumerate(links)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            idx = futures[future]
+            blocks, raw_text, cache_hit = future.result()
+            if blocks:
+                pages[idx] = (blocks, raw_text)
+                cache_status = "cache hit" if cache_hit else "cache miss"
+                progress_messages.append(f"[{idx + 1}] {links[idx]} Extracted! ({cache_status})")
+            else:
+                progress_messages.append(f"[{idx + 1}] {links[idx]} Failed!")
+            progress_percentage = done / total_links
             yield progress_messages, progress_percentage
 
+    # Drop the site chrome repeated across pages, keep the results in the original link order
+    cleaned = html_extract.extract_site_blocks({links[idx]: blocks for idx, (blocks, _) in pages.items()})
+    results = []
+    raw_tokens = content_tokens = 0
+    for idx in sorted(pages):
+        content = ' '.join(cleaned[links[idx]])
+        raw_tokens += count_tokens(pages[idx][1])
+        content_tokens += count_tokens(content)
+        if content:
+            results.append({'link': links[idx], 'content': content})
+    progress_messages.append(
+        f"Boilerplate removed: {raw_tokens - content_tokens} tokens saved ({raw_tokens} -> {content_tokens})."
+    )
+
     # Include the current date in the JSON data
     current_date = datetime.now().strftime('%Y%m%d')
     data = {
@@ -62,101 +124,291 @@ def homepage_check():
         'results': results
     }
 
-    # Save results to a file
-    os.makedirs('data', exist_ok=True)
-    with open('data/homepage_data.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    # Save results to a file and record it in the manifest
+    write_json_artifact('homepage', os.path.join(data_dir, 'homepage_data.json'), data)
 
     progress_messages.append("All links have been processed.")
     yield progress_messages, 1.0
 
 
-def news_search():
-    api_key = os.getenv('NEWS_API_KEY')
+# None uses the NEWS_API_URL setting (newsapi.org by default)
+NEWS_API_URL = None
+NEWS_PAGE_SIZE = 100
+NEWS_MAX_PAGES = 5
+
+
+def parse_article(article):
+    return {
+        'source': article.get('source', {}).get('name'),
+        'author': article.get('author'),
+        'title': article.get('title'),
+        'description': article.get('description'),
+        'url': article.get('url'),
+        'publishedAt': article.get('publishedAt'),
+        'content': article.get('content')
+    }
+
+
+def _get_news_page(url, params):
+    with metrics.span('news_api', page=params.get('page')) as span:
+        response = get_session().get(url, params=params, timeout=REQUEST_TIMEOUT)
+        span['bytes'] = len(response.content)
+    # Raise throttling and server errors so that call_api retries them; other
+    # errors come back as a JSON body with a code and a message
+    if response.status_code in RETRYABLE_STATUS:
+        response.raise_for_status()
+    return response.json()
+
+
+def fetch_news_pages(query, api_key, from_date=None):
+    # Page through /v2/everything, newest first, starting at from_date when given
+    url = NEWS_API_URL or get_settings().news_api_url
+    params = {'q': query, 'apiKey': api_key, 'sortBy': 'publishedAt', 'pageSize': NEWS_PAGE_SIZE}
+    if from_date:
+        params['from'] = from_date
+    articles = []
+    for page in range(1, NEWS_MAX_PAGES + 1):
+        params['page'] = page
+        response = call_api('news_api', _get_news_page, url, dict(params))
+        if response.get('status') != 'ok' and page == 1 and 'from' in params and response.get('code') == 'parameterInvalid':
+            # 'from' is older than the plan allows, ask for everything the plan still serves
+            del params['from']
+            response = call_api('news_api', _get_news_page, url, dict(params))
+        if response.get('status') != 'ok':
+            # The free plan stops paging after its first 100 results
+            if articles and response.get('code') == 'maximumResultsReached':
+                break
+            raise ValueError(response.get('message'))
+        page_articles = response.get('articles', [])
+        articles.extend(page_articles)
+        if len(page_articles) < NEWS_PAGE_SIZE or len(articles) >= response.get('totalResults', 0):
+            break
+    return articles
+
+
+def news_search(company=None, data_dir=DATA_DIR, incremental=True):
+    # incremental: only ask for articles newer than the stored ones and append them to
+    # news_data.jsonl; otherwise replace news_data.json with the latest results
+    company = company or get_company()
+    api_key = get_settings().news_api_key
     if not api_key:
         print("API key not found. Please set NEWS_API_KEY in your .env file.")
+        report_progress("API key not found. Please set NEWS_API_KEY in your .env file.")
         return
 
-    url = f'https://newsapi.org/v2/everything?q=港鐵&apiKey={api_key}'
+    report_progress("[News Search]", 0.1)
+    from_date = news_store.newest_published_at(news_store.read_articles(data_dir)) if incremental else None
+    if from_date:
+        # Never ask for more than the retention window, an old snapshot would be rejected
+        window_start = (datetime.now(timezone.utc) - timedelta(days=news_store.RETENTION_DAYS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        from_date = max(from_date, window_start)
 
     try:
-        response = requests.get(url).json()
-
-        if response.get('status') == 'ok':
-            articles = response.get('articles', [])
-            results = []
-
-            for article in articles:
-                results.append({
-                    'source': article.get('source', {}).get('name'),
-                    'author': article.get('author'),
-                    'title': article.get('title'),
-                    'description': article.get('description'),
-                    'url': article.get('url'),
-                    'publishedAt': article.get('publishedAt'),
-                    'content': article.get('content')
-                })
-
-            # Include the current date in the JSON data
-            current_date = datetime.now().strftime('%Y%m%d')
+        results = [parse_article(article) for article in fetch_news_pages(company['news_query'], api_key, from_date)]
+
+        # Include the current date in the JSON data
+        current_date = datetime.now().strftime('%Y%m%d')
+
+        if incremental:
+            new_articles = news_store.append_articles(data_dir, results)
+            dropped = news_store.compact(data_dir)
+            store_path = os.path.join(data_dir, news_store.NEWS_STORE_NAME)
+            # Mark the store as refreshed even when nothing new was appended
+            with open(store_path, 'a', encoding='utf-8'):
+                os.utime(store_path)
+            update_manifest('news', store_path, current_date, record_count=len(news_store.read_articles(data_dir)))
+            message = f"{len(new_articles)} new news articles have been saved ({dropped} expired)."
+        else:
             data = {
                 'date': current_date,
                 'results': results
             }
 
-            # Save results to a file
-            os.makedirs('data', exist_ok=True)
-            with open('data/news_data.json', 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
+            # Save results to a file and record it in the manifest
+            write_json_artifact('news', os.path.join(data_dir, 'news_data.json'), data)
+            message = "News articles have been processed and saved."
 
-            print("News articles have been processed and saved.")
-        else:
-            print(f"Error fetching news: {response.get('message')}")
+        print(message)
+        report_progress(message)
 
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError, CircuitOpenError) as e:
         print(f"Error fetching news: {e}")
+        report_progress(f"Error fetching news: {e}")
         
         
-def fetch_report():
-    base_url = "https://www.mtr.com.hk/en/corporate/investor/"
-    pdf_base_url = "https://www.mtr.com.hk"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def find_report_link(year, report_config=None):
+    # Return (pdf_url, page_cache_hit) for a year's report page, or None if it has no report
+    report_config = report_config or get_company()['report']
+    url = report_config['page_url'].format(year=year)
+    try:
+        with metrics.span('fetch', url=url) as span:
+            page_body, page_hit = call_api(web_endpoint(url), http_cache.cached_get, get_session(), url, timeout=REQUEST_TIMEOUT)
+            span.update(bytes=len(page_body), cache_hit=page_hit)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return None  # Report not published for this year
+        print(f"Error fetching the report for {year}: {e}")
+        return None
+    except (requests.RequestException, CircuitOpenError) as e:
+        print(f"Error fetching the report for {year}: {e}")
+        return None
+    soup = BeautifulSoup(page_body, 'html.parser')
+    pdf_link = soup.find('a', attrs=report_config['link_attrs'])
+    if not pdf_link:
+        return None
+    return report_config['pdf_base_url'] + pdf_link["href"], page_hit
+
+
+def probe_report_years(years, report_config=None):
+    # Probe all candidate year pages concurrently, return {year: (pdf_url, page_cache_hit)}
+    if not years:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(years))) as executor:
+        links = dict(zip(years, executor.map(lambda year: find_report_link(year, report_config), years)))
+    return {year: link for year, link in links.items() if link}
+
+
+def download_file(url, dest_path, conditional=True):
+    # Stream url to dest_path through a '.part' file and an atomic rename.
+    # An interrupted download is resumed with a Range request; a 304 reuses the cached copy.
+    # Transient failures are retried, each retry resuming from the partial file.
+    # Returns True on a cache hit.
+    with metrics.span('fetch', url=url) as span:
+        hit = call_api(web_endpoint(url), _download_file, url, dest_path, conditional)
+        span.update(bytes=os.path.getsize(dest_path), cache_hit=hit)
+    return hit
+
+
+def _download_file(url, dest_path, conditional=True):
+    part_path = dest_path + '.part'
+    meta_path = part_path + '.json'
+    os.makedirs(os.path.dirname(dest_path) or '.', exist_ok=True)
+
+    headers = {}
+    offset = 0
+    if os.path.exists(part_path) and os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        validator = meta.get('etag') or meta.get('last_modified')
+        if meta.get('url') == url and validator:
+            offset = os.path.getsize(part_path)
+            headers['Range'] = f"bytes={offset}-"
+            headers['If-Range'] = validator
+    if not offset and conditional:
+        headers.update(http_cache.conditional_headers(url))
+
+    with get_session().get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+        if response.status_code == 304:
+            if http_cache.copy_body(url, dest_path):
+                http_cache.record(True)
+                return True
+            # The cached copy is gone, download the full file again
+            return _download_file(url, dest_path, conditional=False)
+        if response.status_code == 416:
+            # The partial file is stale or already complete, start again from scratch
+            os.remove(part_path)
+            os.remove(meta_path)
+            return _download_file(url, dest_path)
+        response.raise_for_status()
+
+        if response.status_code != 206:
+            offset = 0  # Server ignored the range or the file changed
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }, f)
+        with open(part_path, 'ab' if offset else 'wb') as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+        response_headers = response.headers
+
+    sha256 = http_cache.file_sha256(part_path)
+    os.replace(part_path, dest_path)
+    os.remove(meta_path)
+    unchanged = http_cache.store_file(url, response_headers, dest_path, sha256=sha256)
+    http_cache.record(unchanged)
+    return unchanged
+
+
+REPORTS_DIR_NAME = 'annual_reports'
+
+
+def report_pdf_path(data_dir, year):
+    return os.path.join(data_dir, REPORTS_DIR_NAME, f"{year}.pdf")
+
+
+def fetch_report(company=None, data_dir=DATA_DIR):
+    # Download every published report from the first configured year into
+    # annual_reports/<year>.pdf. Published reports do not change, so a year already
+    # on disk is neither probed nor downloaded again. annual_report.json lists the
+    # years newest first; the first entry is the report the analysis runs on.
+    company = company or get_company()
+    report_config = company['report']
     today_date = datetime.now().strftime('%Y%m%d')
     current_year = datetime.now().year
-    
-    for year in range(current_year, 2010, -1): 
-        url = base_url + str(year) + "frpt.html"
-        
+
+    report_progress("[Annual Report Extractor] Looking for the published reports", 0.1)
+    years = list(range(current_year, report_config['first_year'] - 1, -1))
+    downloaded = {year for year in years if os.path.exists(report_pdf_path(data_dir, year))}
+    available = probe_report_years([year for year in years if year not in downloaded], report_config)
+    if not available and not downloaded:
+        print("No annual report found.")
+        report_progress("No annual report found.")
+        return
+
+    def download(year):
+        # Runs in a pool thread, where report_progress has no job: return the error instead
+        pdf_url, page_hit = available[year]
         try:
-            response = requests.get(url)
-            response.raise_for_status()  # Check if the request was successful
-            soup = BeautifulSoup(response.content, 'html.parser')
-            pdf_link = soup.find('a', attrs={'title': 'here'})
-            
-            if pdf_link:
-                pdf_url = pdf_base_url + pdf_link["href"]
-                pdf_response = requests.get(pdf_url)
-                pdf_response.raise_for_status()  
-                
-                # Save the PDF to a file named 'annual_report.pdf'
-                pdf_filename = 'data/annual_report.pdf'
-                os.makedirs('data', exist_ok=True)
-                with open(pdf_filename, 'wb') as f:
-                    f.write(pdf_response.content)
-                
-                print(f"Annual report for {year} has been downloaded and saved as '{pdf_filename}'.")
-
-                # Create the JSON file with the specified structure
-                json_data = {
-                    "date": today_date,
-                    "results": [{"path": pdf_filename, "content": None}]
-                }
-                json_filename = 'data/annual_report.json'
-                with open(json_filename, 'w', encoding='utf-8') as f:
-                    json.dump(json_data, f, ensure_ascii=False, indent=4)
-                
-                print(f"Annual report metadata has been saved as '{json_filename}'.")
-                return  # Exit the function after downloading the latest report
-        except requests.RequestException as e:
-            print(f"Error fetching the report for {year}: {e}")
-
-    print("No annual report found.")
\ No newline at end of file
+            pdf_hit = download_file(pdf_url, report_pdf_path(data_dir, year))
+        except (requests.RequestException, CircuitOpenError) as e:
+            return f"Error fetching the report for {year}: {e}"
+        print(f"Cache for {year}: report page {'hit' if page_hit else 'miss'}, PDF {'hit' if pdf_hit else 'miss'}.")
+        return None
+
+    report_progress(f"Downloading the reports for {', '.join(str(year) for year in sorted(available))}", 0.3)
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, max(len(available), 1))) as executor:
+        errors = dict(zip(available, executor.map(download, available)))
+    for error in errors.values():
+        if error:
+            print(error)
+            report_progress(error)
+    fetched = {year for year, error in errors.items() if not error}
+    stored_years = sorted(downloaded | fetched, reverse=True)
+    if not stored_years or (available and max(available) > stored_years[0]):
+        # The newest report could not be downloaded, keep the previous metadata
+        message = f"The annual report for {max(available)} could not be downloaded."
+        print(message)
+        report_progress(message)
+        raise RuntimeError(message)
+    year = stored_years[0]
+    pdf_filename = report_pdf_path(data_dir, year)
+    print(f"Annual reports for {len(stored_years)} years are in '{os.path.join(data_dir, REPORTS_DIR_NAME)}', the latest is {year}.")
+    report_progress(f"Annual reports for {len(stored_years)} years are saved, the latest is {year}.")
+
+    # Create the JSON file with the specified structure. Years already listed keep their
+    # parsed report store ('content'), so a refresh does not cause them to be parsed again.
+    json_filename = os.path.join(data_dir, 'annual_report.json')
+    try:
+        with open(json_filename, 'r', encoding='utf-8') as f:
+            listed = {entry['year']: entry.get('content') for entry in json.load(f)['results'] if 'year' in entry}
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        listed = {}
+    json_data = {
+        "date": today_date,
+        "company": company['id'],
+        "results": [
+            {"year": stored_year, "path": report_pdf_path(data_dir, stored_year), "content": listed.get(stored_year)}
+            for stored_year in stored_years
+        ]
+    }
+    update_manifest('annual_report_pdf', pdf_filename, today_date, data_dir=data_dir)
+    write_json_artifact('annual_report', json_filename, json_data)
+
+    print(f"Annual report metadata has been saved as '{json_filename}'.")
+    report_progress(f"Annual report metadata has been saved as '{json_filename}'.")
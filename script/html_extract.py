@@ -0,0 +1,117 @@
+import re
+from collections import Counter
+from urllib.parse import urlsplit
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+except ImportError:  # In requirements.txt; without it extraction falls back to html.parser
+    lxml = None
+
+# Main-text extraction for fetched pages.
+# Pages are split into text blocks at block-level elements after dropping the
+# elements that never hold page content (scripts, navigation, headers, footers...).
+# Blocks repeated across pages of the same site (menus, language toggles, legal
+# links) are then recognised as site chrome by extract_site_blocks and removed.
+DROP_TAGS = {
+    'script', 'style', 'noscript', 'template', 'svg', 'iframe', 'canvas',
+    'nav', 'header', 'footer', 'aside', 'form', 'button', 'select',
+}
+DROP_ROLES = {'navigation', 'banner', 'contentinfo', 'search', 'menu', 'menubar'}
+BLOCK_TAGS = {
+    'p', 'div', 'section', 'article', 'main', 'li', 'ul', 'ol', 'dl', 'dt', 'dd',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'tr', 'td', 'th', 'caption',
+    'blockquote', 'pre', 'figure', 'figcaption', 'br', 'hr', 'title', 'body',
+}
+# A block found on at least this share of a site's pages (and on two or more) is chrome
+SHARED_BLOCK_RATIO = 0.5
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _clean(text):
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def _blocks_lxml(body):
+    if not body.strip():
+        return [], ''
+    root = lxml.html.fromstring(body)
+    raw_text = root.text_content()
+    for element in list(root.iter()):
+        if not isinstance(element.tag, str):
+            element.drop_tree()  # Comments and processing instructions
+        elif element.tag in DROP_TAGS or element.get('role') in DROP_ROLES:
+            element.drop_tree()
+    blocks = []
+    current = []
+
+    def flush():
+        text = _clean(' '.join(current))
+        if text:
+            blocks.append(text)
+        current.clear()
+
+    def walk(element):
+        block = element.tag in BLOCK_TAGS
+        if block:
+            flush()
+        if element.text:
+            current.append(element.text)
+        for child in element:
+            walk(child)
+            if child.tail:
+                current.append(child.tail)
+        if block:
+            flush()
+
+    walk(root)
+    flush()
+    return blocks, raw_text
+
+
+def _blocks_bs4(body):
+    soup = BeautifulSoup(body, 'html.parser')
+    raw_text = soup.get_text(' ')
+    for element in soup.find_all(lambda tag: tag.name in DROP_TAGS or tag.get('role') in DROP_ROLES):
+        if not element.decomposed:  # Already gone with a dropped ancestor
+            element.decompose()
+    for element in soup.find_all(BLOCK_TAGS):
+        element.insert_before('\n')
+        element.insert_after('\n')
+    return [text for text in (_clean(line) for line in soup.get_text().split('\n')) if text], raw_text
+
+
+ENGINES = {'lxml': _blocks_lxml, 'bs4': _blocks_bs4}
+DEFAULT_ENGINE = 'lxml' if lxml is not None else 'bs4'
+
+
+def extract_page(body, engine=None):
+    # (text blocks in document order, text of the whole document before any removal)
+    return ENGINES[engine or DEFAULT_ENGINE](body)
+
+
+def site_key(url):
+    return urlsplit(url).netloc.lower()
+
+
+def shared_blocks(pages_blocks):
+    # Blocks repeated on most pages of one site
+    if len(pages_blocks) < 2:
+        return set()
+    counts = Counter(block for blocks in pages_blocks for block in set(blocks))
+    threshold = max(2, len(pages_blocks) * SHARED_BLOCK_RATIO)
+    return {block for block, count in counts.items() if count >= threshold}
+
+
+def extract_site_blocks(pages):
+    # {url: blocks} -> {url: blocks without the chrome shared across pages of the same site}
+    sites = {}
+    for url, blocks in pages.items():
+        sites.setdefault(site_key(url), []).append(url)
+    cleaned = {}
+    for urls in sites.values():
+        chrome = shared_blocks([pages[url] for url in urls])
+        for url in urls:
+            cleaned[url] = [block for block in pages[url] if block not in chrome]
+    return cleaned
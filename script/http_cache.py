@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+# Persistent HTTP cache for pages and reports fetched by script/fetch_data.py.
+# Each URL keeps its ETag / Last-Modified validators and the SHA-256 of its body;
+# bodies are stored once per hash under CACHE_DIR and evicted least-recently-used
+# when the total size goes over MAX_CACHE_BYTES.
+CACHE_DIR = 'data/http_cache'
+INDEX_PATH = os.path.join(CACHE_DIR, 'index.json')
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+_lock = threading.RLock()
+_index = None
+stats = {'hits': 0, 'misses': 0}
+
+
+def _load_index():
+    global _index
+    if _index is None:
+        try:
+            with open(INDEX_PATH, 'r', encoding='utf-8') as f:
+                _index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            _index = {}
+    return _index
+
+
+def _save_index():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = INDEX_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_index, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, INDEX_PATH)
+
+
+def _body_path(sha256):
+    return os.path.join(CACHE_DIR, sha256)
+
+
+def lookup(url):
+    # Return the cache entry for a URL if its body is still on disk
+    with _lock:
+        entry = _load_index().get(url)
+        if entry and os.path.exists(_body_path(entry['sha256'])):
+            return entry
+        return None
+
+
+def conditional_headers(url):
+    # Validators to send so that the server can answer 304 Not Modified
+    entry = lookup(url)
+    headers = {}
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def load_body(url):
+    entry = lookup(url)
+    if entry is None:
+        return None
+    touch(url)
+    with open(_body_path(entry['sha256']), 'rb') as f:
+        return f.read()
+
+
+def touch(url):
+    with _lock:
+        entry = _load_index().get(url)
+        if entry:
+            entry['last_access'] = time.time()
+            _save_index()
+
+
+def store(url, headers, body):
+    # Save a 200 response body and its validators, return True if the body is unchanged
+    sha256 = hashlib.sha256(body).hexdigest()
+    with _lock:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = _body_path(sha256)
+        if not os.path.exists(path):
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        return _register(url, headers, sha256, len(body))
+
+
+def store_file(url, headers, src_path, sha256=None):
+    # Same as store() for a body already written to disk, copied in chunks
+    if sha256 is None:
+        sha256 = file_sha256(src_path)
+    with _lock:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = _body_path(sha256)
+        if not os.path.exists(path):
+            tmp_path = path + '.tmp'
+            shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, path)
+        return _register(url, headers, sha256, os.path.getsize(path))
+
+
+def copy_body(url, dest_path):
+    # Copy a cached body to dest_path without loading it in memory, return False on a miss
+    entry = lookup(url)
+    if entry is None:
+        return False
+    touch(url)
+    if os.path.exists(dest_path) and file_sha256(dest_path) == entry['sha256']:
+        return True
+    tmp_path = dest_path + '.tmp'
+    shutil.copyfile(_body_path(entry['sha256']), tmp_path)
+    os.replace(tmp_path, dest_path)
+    return True
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _register(url, headers, sha256, size):
+    index = _load_index()
+    previous = index.get(url)
+    unchanged = previous is not None and previous['sha256'] == sha256
+    index[url] = {
+        'etag': headers.get('ETag'),
+        'last_modified': headers.get('Last-Modified'),
+        'sha256': sha256,
+        'size': size,
+        'last_access': time.time(),
+    }
+    if previous and previous['sha256'] != sha256:
+        _remove_orphan(previous['sha256'])
+    _evict()
+    _save_index()
+    return unchanged
+
+
+def _remove_orphan(sha256):
+    # Delete a body file once no URL refers to it any more
+    if not any(entry['sha256'] == sha256 for entry in _index.values()):
+        try:
+            os.remove(_body_path(sha256))
+        except FileNotFoundError:
+            pass
+
+
+def _evict():
+    # Drop least recently used entries until the cache fits in MAX_CACHE_BYTES
+    sizes = {}
+    for entry in _index.values():
+        sizes[entry['sha256']] = entry['size']
+    total = sum(sizes.values())
+    for url, entry in sorted(_index.items(), key=lambda item: item[1]['last_access']):
+        if total <= MAX_CACHE_BYTES:
+            break
+        del _index[url]
+        if entry['sha256'] in sizes and not any(e['sha256'] == entry['sha256'] for e in _index.values()):
+            total -= sizes.pop(entry['sha256'])
+            _remove_orphan(entry['sha256'])
+
+
+def record(hit):
+    with _lock:
+        stats['hits' if hit else 'misses'] += 1
+
+
+def cached_get(session, url, **kwargs):
+    # Conditional GET through the cache, returns (body, cache_hit).
+    # A 304 or a 200 with an identical body hash both count as a hit.
+    headers = dict(kwargs.pop('headers', None) or {})
+    headers.update(conditional_headers(url))
+    response = session.get(url, headers=headers, **kwargs)
+    if response.status_code == 304:
+        body = load_body(url)
+        if body is not None:
+            record(True)
+            return body, True
+        # The stored body disappeared, fetch it again without validators
+        headers.pop('If-None-Match', None)
+        headers.pop('If-Modified-Since', None)
+        response = session.get(url, headers=headers, **kwargs)
+    response.raise_for_status()
+    unchanged = store(url, response.headers, response.content)
+    record(unchanged)
+    return response.content, unchanged
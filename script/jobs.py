@@ -0,0 +1,116 @@
+import hashlib
+import json
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Background runner for the long pipeline stages (fetching, parsing, analysing).
+# Jobs are registered under (stage, input hash): submitting a stage whose identical
+# job is still queued or running returns that job instead of starting another one,
+# so concurrent Streamlit sessions share the upstream work.
+MAX_WORKERS = 4
+FINISHED_JOB_TTL = 60 * 60
+
+_current = threading.local()
+
+
+class Job:
+    def __init__(self, stage, key):
+        self.id = uuid.uuid4().hex
+        self.stage = stage
+        self.key = key
+        self.status = 'queued'
+        self.progress_messages = []
+        self.progress = 0.0
+        self.output = ''
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ('done', 'failed')
+
+
+def report_progress(message=None, progress=None):
+    # Report progress of the job running in this thread, a no-op outside a job
+    job = getattr(_current, 'job', None)
+    if job is None:
+        return
+    if message is not None:
+        job.progress_messages.append(message)
+    if progress is not None:
+        job.progress = progress
+
+
+def input_hash(*args, **kwargs):
+    payload = json.dumps({'args': args, 'kwargs': kwargs}, sort_keys=True, default=repr)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class JobRunner:
+    def __init__(self, max_workers=MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._active = {}
+        self._jobs = {}
+
+    def submit(self, stage, func, *args, key_input=None, **kwargs):
+        # key_input identifies the stage's input when it is not fully given by the arguments
+        # (e.g. the hash of the file it reads); by default the arguments are hashed
+        key = (stage, input_hash(key_input) if key_input is not None else input_hash(*args, **kwargs))
+        with self._lock:
+            self._prune()
+            job = self._active.get(key)
+            if job is not None and not job.done:
+                return job
+            job = Job(stage, key)
+            self._active[key] = job
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, func, args, kwargs):
+        _current.job = job
+        job.status = 'running'
+        try:
+            result = func(*args, **kwargs)
+            # Generators report as they go: (messages, progress) tuples like homepage_check,
+            # or text pieces of a streamed LLM response
+            if hasattr(result, '__next__'):
+                for item in result:
+                    if isinstance(item, tuple):
+                        job.progress_messages, job.progress = list(item[0]), item[1]
+                    else:
+                        job.output += item
+                result = job.output or None
+            job.result = result
+            job.progress = 1.0
+            job.status = 'done'
+        except Exception as e:
+            job.error = f"{e}\n{traceback.format_exc()}"
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            _current.job = None
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+
+    def _prune(self):
+        # Forget finished jobs after FINISHED_JOB_TTL
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.done and now - job.finished_at > FINISHED_JOB_TTL:
+                del self._jobs[job_id]
+
+
+# Shared by every Streamlit session in the process
+runner = JobRunner()
@@ -0,0 +1,202 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Process-wide client controls per upstream API, shared by the Streamlit app and the
+# batch runner so that fanning out over many companies never exceeds them:
+#  - a token bucket caps the request rate,
+#  - an adaptive concurrency limit halves on 429 responses and grows back by one
+#    after a run of successes, so throughput settles just under the quota,
+#  - call_api retries throttled and transient failures with jittered exponential
+#    backoff, honouring Retry-After,
+#  - a circuit breaker stops calling an endpoint while it keeps failing.
+DEFAULT_LIMITS = {
+    'news_api': 2,
+    'document_intelligence': 4,
+    'openai': 8,
+    'web': 4,
+}
+# Requests per second, bursts of up to one second's worth are allowed
+DEFAULT_RATES = {
+    'news_api': 1.0,
+    'document_intelligence': 5.0,
+    'openai': 5.0,
+    'web': 10.0,
+}
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+BREAKER_FAILURES = 5
+BREAKER_RESET_SECONDS = 30.0
+SUCCESSES_TO_GROW = 10
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# Transport errors of requests, openai and azure-core, matched by name so that this
+# module does not have to import the SDKs
+RETRYABLE_ERRORS = {
+    'ConnectionError', 'Timeout', 'ConnectTimeout', 'ReadTimeout', 'TimeoutError', 'ChunkedEncodingError',
+    'APIConnectionError', 'ServiceUnavailableError', 'TryAgain',
+    'ServiceRequestError', 'ServiceResponseError',
+}
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class Endpoint:
+    def __init__(self, name, limit, rate):
+        self.name = name
+        self.max_limit = limit
+        self.limit = limit
+        self.rate = rate
+        self._active = 0
+        self._tokens = max(rate, 1.0)
+        self._refilled_at = time.monotonic()
+        self._successes = 0
+        self._failures = 0
+        self._opened_at = None
+        self._condition = threading.Condition()
+
+    def set_limit(self, limit):
+        with self._condition:
+            self.max_limit = self.limit = limit
+            self._condition.notify_all()
+
+    def _take_token(self):
+        # Token bucket, sleeps until a token is available
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._refilled_at) * self.rate)
+                self._refilled_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def _check_breaker(self):
+        with self._condition:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < BREAKER_RESET_SECONDS:
+                raise CircuitOpenError(f"{self.name} is failing, calls are paused")
+            # Half-open: let calls through, the next failure opens it again
+            self._opened_at = None
+            self._failures = BREAKER_FAILURES - 1
+
+    @contextmanager
+    def slot(self):
+        self._check_breaker()
+        self._take_token()
+        with self._condition:
+            while self._active >= self.limit:
+                self._condition.wait()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+
+    def record_success(self):
+        with self._condition:
+            self._failures = 0
+            self._successes += 1
+            if self._successes >= SUCCESSES_TO_GROW and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify_all()
+
+    def record_failure(self, throttled):
+        with self._condition:
+            self._successes = 0
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                return
+            self._failures += 1
+            if self._failures >= BREAKER_FAILURES:
+                self._opened_at = time.monotonic()
+
+
+_lock = threading.Lock()
+_endpoints = {}
+
+
+def get_endpoint(name):
+    # Names such as 'web:www.mtr.com.hk' share the defaults of their prefix
+    with _lock:
+        if name not in _endpoints:
+            base = name.split(':', 1)[0]
+            _endpoints[name] = Endpoint(name, DEFAULT_LIMITS.get(base, 4), DEFAULT_RATES.get(base, 5.0))
+        return _endpoints[name]
+
+
+def set_limit(name, limit):
+    # Maximum concurrency of an endpoint, takes effect for requests started after the call
+    DEFAULT_LIMITS[name] = limit
+    get_endpoint(name).set_limit(limit)
+
+
+@contextmanager
+def concurrency_limit(name):
+    # Rate and concurrency limits only, for calls that handle their own errors
+    with get_endpoint(name).slot():
+        yield
+
+
+def _status_code(error):
+    for source in (error, getattr(error, 'response', None)):
+        for attr in ('status_code', 'http_status'):
+            status = getattr(source, attr, None)
+            if isinstance(status, int):
+                return status
+    return None
+
+
+def _retry_after(error):
+    for source in (error, getattr(error, 'response', None)):
+        headers = getattr(source, 'headers', None)
+        if headers:
+            value = headers.get('Retry-After') or headers.get('retry-after')
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+def is_retryable(error):
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+def call_api(name, func, *args, **kwargs):
+    # Call func through the endpoint's limits, retrying throttled and transient failures
+    endpoint = get_endpoint(name)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with endpoint.slot():
+                result = func(*args, **kwargs)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            throttled = _status_code(e) == 429
+            endpoint.record_failure(throttled)
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+                delay = random.uniform(delay / 2, delay)
+            time.sleep(delay)
+        else:
+            endpoint.record_success()
+            return result
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import sqlite3
+import re
+import time
+from script import metrics
+from script.config import get_openai
+from script.limits import call_api
+
+# Content-addressed cache for ChatCompletion responses, shared by every prompt in script/.
+# Entries are keyed on a hash of the engine, the messages and the sampling parameters,
+# expire after CACHE_TTL seconds and are evicted least-recently-used above CACHE_MAX_BYTES.
+CACHE_PATH = 'data/llm_cache.sqlite'
+CACHE_TTL = 7 * 24 * 60 * 60
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Without tiktoken token counts are estimated on the high side, so budgets still hold:
+# cl100k_base takes up to two tokens for most CJK characters and about four characters
+# of other text per token
+_CJK_PATTERN = re.compile(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]')
+ESTIMATED_CJK_TOKENS = 2
+ESTIMATED_CHARS_PER_TOKEN = 3
+_encoding = None
+
+
+def _get_encoding():
+    # tiktoken is in requirements.txt; without it, or when its encoding file cannot be
+    # downloaded (OSError), token counts are estimated
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding('cl100k_base')
+        except (ImportError, OSError):
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return ESTIMATED_CJK_TOKENS * cjk + (other + ESTIMATED_CHARS_PER_TOKEN - 1) // ESTIMATED_CHARS_PER_TOKEN
+
+
+def _connect():
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=30)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )"""
+    )
+    return conn
+
+
+def cache_key(engine, messages, params):
+    payload = json.dumps({'engine': engine, 'messages': messages, 'params': params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cache_get(key, ttl=CACHE_TTL):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        response, created_at = row
+        now = time.time()
+        if now - created_at > ttl:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return response
+    finally:
+        conn.close()
+
+
+def cache_put(key, response):
+    conn = _connect()
+    try:
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, response, len(response.encode('utf-8')), now, now),
+        )
+        _evict(conn, now)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _evict(conn, now):
+    # Drop expired entries, then the least recently used ones until under CACHE_MAX_BYTES
+    conn.execute("DELETE FROM responses WHERE created_at < ?", (now - CACHE_TTL,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= CACHE_MAX_BYTES:
+        return
+    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        total -= size
+        if total <= CACHE_MAX_BYTES:
+            break
+
+
+def _request(engine, messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty):
+    engine = engine or get_openai().engine
+    params = {
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+        'top_p': top_p,
+        'frequency_penalty': frequency_penalty,
+        'presence_penalty': presence_penalty,
+    }
+    return engine, params, cache_key(engine, messages, params)
+
+
+def chat_completion(messages, temperature=0, max_tokens=1000, top_p=0.95,
+                    frequency_penalty=0, presence_penalty=0, engine=None,
+                    use_cache=True, ttl=CACHE_TTL):
+    # Drop-in replacement for openai.ChatCompletion.create(...)["choices"][0]["message"]["content"]
+    engine, params, key = _request(engine, messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty)
+    with metrics.span('llm', engine=engine, cache_hit=False) as span:
+        if use_cache:
+            cached = cache_get(key, ttl)
+            if cached is not None:
+                span['cache_hit'] = True
+                return cached
+
+        completion = call_api(
+            'openai', get_openai().ChatCompletion.create,
+            engine=engine,
+            messages=messages,
+            **params,
+        )
+        response = completion["choices"][0]["message"]["content"]
+        usage = completion.get("usage") or {}
+        span['prompt_tokens'] = usage.get("prompt_tokens")
+        span['completion_tokens'] = usage.get("completion_tokens")
+
+    if use_cache:
+        cache_put(key, response)
+    return response
+
+
+def chat_completion_stream(messages, temperature=0, max_tokens=1000, top_p=0.95,
+                           frequency_penalty=0, presence_penalty=0, engine=None,
+                           use_cache=True, ttl=CACHE_TTL):
+    # Same as chat_completion() but yields the response text piece by piece as it arrives.
+    # A cached response is yielded in one piece; a streamed one is cached once complete.
+    engine, params, key = _request(engine, messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty)
+    if use_cache:
+        cached = cache_get(key, ttl)
+        if cached is not None:
+            metrics.record('llm', 0.0, engine=engine, cache_hit=True)
+            yield cached
+            return
+
+    pieces = []
+    # Streamed responses carry no usage, so the token counts are estimated
+    with metrics.span('llm', engine=engine, cache_hit=False, stream=True) as span:
+        span['prompt_tokens'] = sum(count_tokens(message['content']) for message in messages)
+        # Only opening the stream is retried, a failure mid-stream is raised to the caller
+        stream = call_api('openai', get_openai().ChatCompletion.create, engine=engine, messages=messages, stream=True, **params)
+        for chunk in stream:
+            # Azure sends an initial chunk without choices for the content filter results
+            if not chunk.get("choices"):
+                continue
+            piece = chunk["choices"][0].get("delta", {}).get("content")
+            if piece:
+                pieces.append(piece)
+                yield piece
+        span['completion_tokens'] = count_tokens(''.join(pieces))
+
+    if use_cache:
+        cache_put(key, ''.join(pieces))
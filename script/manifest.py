@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import threading
+
+# Small index of the artifacts under data/ (date, size, content hash, record count),
+# so pages can show update dates without opening the artifacts themselves.
+# Each data directory has its own manifest, next to the artifacts it describes.
+# Both the manifest and the artifact loaders are memoized on file mtime.
+MANIFEST_NAME = 'manifest.json'
+
+_lock = threading.Lock()
+_json_cache = {}
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def atomic_write(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_json(path):
+    # json.load memoized on the file's mtime and size, raises FileNotFoundError like open()
+    signature = _file_signature(path)
+    cached = _json_cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    _json_cache[path] = (signature, data)
+    return data
+
+
+def manifest_path(data_dir='data'):
+    return os.path.join(data_dir, MANIFEST_NAME)
+
+
+def read_manifest(data_dir='data'):
+    try:
+        return load_json(manifest_path(data_dir))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def update_manifest(name, path, date, record_count=None, sha256=None, data_dir=None):
+    # Record an artifact that has just been written to path, in the manifest of data_dir
+    # (by default the directory holding path; pass it for an artifact in a subdirectory)
+    if sha256 is None and os.path.isfile(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+    entry = {
+        'path': path,
+        'date': date,
+        'size': os.path.getsize(path) if os.path.isfile(path) else None,
+        'sha256': sha256,
+        'record_count': record_count,
+    }
+    data_dir = data_dir or os.path.dirname(os.path.normpath(path))
+    with _lock:
+        manifest = dict(read_manifest(data_dir))
+        manifest[name] = entry
+        atomic_write(manifest_path(data_dir), json.dumps(manifest, ensure_ascii=False, indent=4).encode('utf-8'))
+    return entry
+
+
+def write_json_artifact(name, path, data):
+    # Atomically write a {'date', 'results'} JSON artifact and record it in the manifest
+    body = json.dumps(data, ensure_ascii=False, indent=4).encode('utf-8')
+    atomic_write(path, body)
+    return update_manifest(
+        name, path, data.get('date'),
+        record_count=len(data.get('results') or []),
+        sha256=hashlib.sha256(body).hexdigest(),
+    )
+
+
+def artifact_date(name, path):
+    # Date of an artifact from the manifest, registering artifacts written before the manifest existed
+    entry = read_manifest(os.path.dirname(os.path.normpath(path))).get(name)
+    if entry and entry.get('path') == path and os.path.exists(path):
+        return entry['date']
+    if not path.endswith('.json'):
+        return None
+    try:
+        data = load_json(path)
+    except FileNotFoundError:
+        return None
+    update_manifest(name, path, data.get('date'), record_count=len(data.get('results') or []))
+    return data.get('date')
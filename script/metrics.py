@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from script.manifest import atomic_write
+
+# Per-stage instrumentation: every span records its wall time, bytes transferred,
+# prompt/completion tokens and cache hit or miss.
+# Spans are appended to a rotating JSONL trace; running totals are kept in memory
+# and written as a Prometheus text snapshot after each span.
+METRICS_DIR = 'data/metrics'
+TRACE_NAME = 'trace.jsonl'
+SNAPSHOT_NAME = 'metrics.prom'
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUPS = 5
+
+_lock = threading.Lock()
+_totals = {}
+_logger = None
+
+
+def _trace_logger():
+    # Set up once under the lock, concurrent first spans would attach duplicate handlers
+    global _logger
+    if _logger is None:
+        with _lock:
+            if _logger is None:
+                os.makedirs(METRICS_DIR, exist_ok=True)
+                logger = logging.getLogger('company_insight.trace')
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                handler = RotatingFileHandler(
+                    os.path.join(METRICS_DIR, TRACE_NAME),
+                    maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUPS, encoding='utf-8',
+                )
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger.addHandler(handler)
+                _logger = logger
+    return _logger
+
+
+def _add(metric, labels, value):
+    key = (metric, tuple(sorted(labels.items())))
+    _totals[key] = _totals.get(key, 0) + value
+
+
+def record(stage, seconds, status='ok', **fields):
+    # Record one finished span. Known fields: bytes, prompt_tokens, completion_tokens,
+    # cache_hit (bool); any other field only goes to the trace.
+    entry = {'ts': round(time.time(), 3), 'stage': stage, 'seconds': round(seconds, 6), 'status': status}
+    entry.update(fields)
+    with _lock:
+        _add('pipeline_stage_calls_total', {'stage': stage, 'status': status}, 1)
+        _add('pipeline_stage_seconds_total', {'stage': stage}, seconds)
+        if fields.get('bytes'):
+            _add('pipeline_bytes_total', {'stage': stage}, fields['bytes'])
+        for kind in ('prompt', 'completion'):
+            if fields.get(f'{kind}_tokens'):
+                _add('pipeline_tokens_total', {'stage': stage, 'kind': kind}, fields[f'{kind}_tokens'])
+        if fields.get('cache_hit') is not None:
+            _add('pipeline_cache_total', {'stage': stage, 'result': 'hit' if fields['cache_hit'] else 'miss'}, 1)
+        snapshot = _prometheus_text(_totals)
+    _trace_logger().info(json.dumps(entry, ensure_ascii=False, default=str))
+    atomic_write(os.path.join(METRICS_DIR, SNAPSHOT_NAME), snapshot.encode('utf-8'))
+    return entry
+
+
+@contextmanager
+def span(stage, **fields):
+    # Time the block; the yielded dict collects fields to record with the span
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        yield fields
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        record(stage, time.perf_counter() - started, status, **fields)
+
+
+def totals():
+    # {(metric, ((label, value), ...)): total}
+    with _lock:
+        return dict(_totals)
+
+
+def stage_summary():
+    # {stage: {'calls', 'errors', 'seconds', 'bytes', 'prompt_tokens', 'completion_tokens', 'cache_hits', 'cache_misses'}}
+    summary = {}
+    for (metric, labels), value in totals().items():
+        labels = dict(labels)
+        row = summary.setdefault(labels['stage'], {
+            'calls': 0, 'errors': 0, 'seconds': 0.0, 'bytes': 0,
+            'prompt_tokens': 0, 'completion_tokens': 0, 'cache_hits': 0, 'cache_misses': 0,
+        })
+        if metric == 'pipeline_stage_calls_total':
+            row['calls'] += value
+            if labels['status'] == 'error':
+                row['errors'] += value
+        elif metric == 'pipeline_stage_seconds_total':
+            row['seconds'] += value
+        elif metric == 'pipeline_bytes_total':
+            row['bytes'] += value
+        elif metric == 'pipeline_tokens_total':
+            row[f"{labels['kind']}_tokens"] += value
+        elif metric == 'pipeline_cache_total':
+            row['cache_hits' if labels['result'] == 'hit' else 'cache_misses'] += value
+    return summary
+
+
+def _prometheus_text(totals):
+    lines = []
+    for metric in sorted({metric for metric, _ in totals}):
+        lines.append(f"# TYPE {metric} counter")
+        for (name, labels), value in sorted(totals.items()):
+            if name == metric:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f"{metric}{{{label_text}}} {round(value, 6)}")
+    return '\n'.join(lines) + '\n'
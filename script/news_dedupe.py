@@ -0,0 +1,118 @@
+import re
+import numpy as np
+
+# Near-duplicate clustering of news articles (syndicated copies, light rewrites).
+# Each article's title, description and content are reduced to character 3-gram
+# hashes and a MinHash signature, computed for all articles at once with NumPy.
+# LSH banding proposes candidate pairs, pairs whose estimated Jaccard similarity
+# reaches SIMILARITY_THRESHOLD are merged, and each cluster keeps one representative.
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 16
+SIMILARITY_THRESHOLD = 0.6
+
+_rng = np.random.default_rng(20240713)
+_PERM_A = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+_BAND_MULT = _rng.integers(1, 2 ** 63, NUM_PERM // BANDS, dtype=np.uint64) | np.uint64(1)
+_SHINGLE_MULT = np.uint64(1000003)
+
+# News API truncates content with a "[+1234 chars]" marker
+_TRUNCATION_PATTERN = re.compile(r'\[\+\d+ chars\]')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def article_text(article):
+    fields = [article.get('title'), article.get('description'), article.get('content')]
+    text = ' '.join(field for field in fields if field)
+    text = _TRUNCATION_PATTERN.sub(' ', text.lower())
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def shingle_hashes(texts):
+    # Character n-gram hashes of all texts at once, plus the offset of each text's first hash.
+    # Works for CJK text without word breaks; texts must not be empty. Each text yields
+    # one hash per character, its last n-grams being padded with NUL characters.
+    padding = '\0' * (SHINGLE_SIZE - 1)
+    codes = np.frombuffer((padding.join(texts) + padding).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    lengths = np.array([len(text) for text in texts], dtype=np.int64)
+    count = len(codes) - SHINGLE_SIZE + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for i in range(SHINGLE_SIZE):
+        hashes = hashes * _SHINGLE_MULT + codes[i:i + count]
+    # Keep the n-grams starting inside a text, not in the padding after it
+    offsets = np.zeros(len(texts), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    starts = offsets + np.arange(len(texts)) * (SHINGLE_SIZE - 1)
+    positions = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+    return hashes[positions], offsets
+
+
+def minhash_signatures(texts):
+    # (len(texts), NUM_PERM) MinHash signatures; texts must not be empty
+    hashes, offsets = shingle_hashes(texts)
+    signatures = np.empty((len(texts), NUM_PERM), dtype=np.uint64)
+    # a * x + b with odd a is a permutation of the uint64 range (arithmetic wraps)
+    for perm in range(NUM_PERM):
+        signatures[:, perm] = np.minimum.reduceat(hashes * _PERM_A[perm] + _PERM_B[perm], offsets)
+    return signatures
+
+
+def candidate_pairs(signatures):
+    # Pairs of rows sharing at least one LSH band bucket
+    rows = NUM_PERM // BANDS
+    pairs = []
+    for band in range(BANDS):
+        keys = (signatures[:, band * rows:(band + 1) * rows] * _BAND_MULT).sum(axis=1)
+        order = np.argsort(keys, kind='stable')
+        same = keys[order[1:]] == keys[order[:-1]]
+        # Neighbours in sorted order chain every bucket together
+        pairs.append(np.stack([order[:-1][same], order[1:][same]], axis=1))
+    pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.sort(pairs, axis=1), axis=0)
+
+
+def cluster_labels(texts, threshold=SIMILARITY_THRESHOLD):
+    # Cluster id per text; empty texts are never merged
+    labels = np.arange(len(texts))
+    indices = np.array([i for i, text in enumerate(texts) if text], dtype=np.int64)
+    if len(indices) < 2:
+        return labels
+    signatures = minhash_signatures([texts[i] for i in indices])
+    pairs = candidate_pairs(signatures)
+    if len(pairs):
+        similarity = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+        pairs = pairs[similarity >= threshold]
+
+    # Union-find over the confirmed pairs
+    parent = list(range(len(indices)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in pairs.tolist():
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+    for position, index in enumerate(indices):
+        labels[index] = indices[find(position)]
+    return labels
+
+
+def dedupe_articles(articles, threshold=SIMILARITY_THRESHOLD):
+    # One representative per cluster of near-duplicates, in order of first appearance.
+    # The representative is the cluster's most detailed article, returned as a copy
+    # with 'duplicate_count' set to the size of its cluster.
+    texts = [article_text(article) for article in articles]
+    labels = cluster_labels(texts, threshold)
+    clusters = {}
+    for index, label in enumerate(labels.tolist()):
+        clusters.setdefault(label, []).append(index)
+    representatives = []
+    for members in clusters.values():
+        best = max(members, key=lambda i: len(texts[i]))
+        representatives.append((members[0], dict(articles[best], duplicate_count=len(members))))
+    return [article for _, article in sorted(representatives, key=lambda item: item[0])]
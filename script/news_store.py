@@ -0,0 +1,100 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit, urlunsplit
+
+# Append-only news history: one article per line in news_data.jsonl.
+# Refreshes append only the articles whose URL is not stored yet, and entries older
+# than RETENTION_DAYS are dropped by an occasional compaction.
+NEWS_STORE_NAME = 'news_data.jsonl'
+LEGACY_NEWS_NAME = 'news_data.json'
+RETENTION_DAYS = 90
+# Compact only once this many days of expired entries have built up, so that
+# a refresh normally never rewrites the file
+COMPACTION_SLACK_DAYS = 7
+
+_cache = {}
+
+
+def news_path(data_dir):
+    # The append-only store, or the snapshot written before it existed
+    path = os.path.join(data_dir, NEWS_STORE_NAME)
+    legacy_path = os.path.join(data_dir, LEGACY_NEWS_NAME)
+    if not os.path.exists(path) and os.path.exists(legacy_path):
+        return legacy_path
+    return path
+
+
+def normalize_url(url):
+    # Ignore fragments, trailing slashes and host case when comparing article URLs
+    parts = urlsplit(url or '')
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), parts.query, ''))
+
+
+def read_articles(data_dir):
+    # All stored articles, memoized on the file's mtime and size
+    path = news_path(data_dir)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return []
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            articles = [json.loads(line) for line in f if line.strip()]
+        else:
+            articles = json.load(f).get('results', [])
+    _cache[path] = (signature, articles)
+    return articles
+
+
+def newest_published_at(articles):
+    dates = [article['publishedAt'] for article in articles if article.get('publishedAt')]
+    return max(dates) if dates else None
+
+
+def append_articles(data_dir, articles):
+    # Append the articles whose URL is not stored yet, return the ones appended
+    stored = read_articles(data_dir)
+    path = os.path.join(data_dir, NEWS_STORE_NAME)
+    os.makedirs(data_dir, exist_ok=True)
+    lines = []
+    if not os.path.exists(path) and stored:
+        # First incremental run: carry over the articles of the old snapshot
+        lines.extend(stored)
+    seen = {normalize_url(article.get('url')) for article in stored}
+    new_articles = []
+    for article in articles:
+        url = normalize_url(article.get('url'))
+        if url in seen:
+            continue
+        seen.add(url)
+        new_articles.append(article)
+    lines.extend(new_articles)
+    if lines:
+        with open(path, 'a', encoding='utf-8') as f:
+            for article in lines:
+                f.write(json.dumps(article, ensure_ascii=False) + '\n')
+    return new_articles
+
+
+def compact(data_dir, retention_days=RETENTION_DAYS):
+    # Drop articles older than the retention window, return the number dropped
+    path = os.path.join(data_dir, NEWS_STORE_NAME)
+    articles = read_articles(data_dir) if os.path.exists(path) else []
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(days=retention_days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    slack_cutoff = (now - timedelta(days=retention_days + COMPACTION_SLACK_DAYS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    dates = [article.get('publishedAt') for article in articles if article.get('publishedAt')]
+    if not dates or min(dates) >= slack_cutoff:
+        return 0
+    kept = [article for article in articles if (article.get('publishedAt') or cutoff) >= cutoff]
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for article in kept:
+            f.write(json.dumps(article, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+    return len(articles) - len(kept)
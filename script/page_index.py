@@ -0,0 +1,191 @@
+import re
+from itertools import repeat
+import numpy as np
+
+# Local lexical index over the pages of a parsed report, used to find the financial
+# statements by their content rather than by the page numbers printed on the Contents page.
+# Every page has two BM25 fields: its title zone (the first TITLE_LINES lines, where a
+# statement's name is printed) and its full text plus table headers. Unigrams and
+# bigrams are indexed, so a statement's wording scores as a phrase. Scoring a query
+# over all pages is a handful of NumPy operations.
+TITLE_LINES = 6
+TITLE_WEIGHT = 3.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+STOP_WORDS = {'a', 'an', 'and', 'or', 'of', 'the', 'in', 'for', 'to', 'on'}
+
+# Pages naming this many statements (Contents, auditor's report) list them rather than hold them
+LISTING_LABELS = 3
+LISTING_PENALTY = 0.2
+NO_TABLE_PENALTY = 0.5
+# Following pages whose title zone scores at least this share of the first page's continue the statement
+CONTINUATION_RATIO = 0.6
+MAX_STATEMENT_PAGES = 6
+# 1 - (best score elsewhere / best score); below the threshold a location is not trusted.
+# A statement only counts as found on a page it owns whose title zone holds one of its
+# wordings in full; otherwise its confidence is 0, whatever the other pages score.
+LOCATE_CONFIDENCE_THRESHOLD = 0.3
+
+_WORD_PATTERN = re.compile(r'[a-z]+')
+
+
+def _words(text):
+    return [word for word in _WORD_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+
+
+def tokenize(text):
+    words = _words(text)
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class PageIndex:
+    def __init__(self, fields, terms):
+        # fields: {field name: [text per page]}, every field covering the same pages.
+        # Only terms (words and 'word word' bigrams, e.g. from tokenize) are indexed.
+        self.terms = {term: i for i, term in enumerate(dict.fromkeys(terms))}
+        self._word_ids = {}
+        for term in self.terms:
+            for word in term.split(' '):
+                self._word_ids.setdefault(word, len(self._word_ids))
+        word_count = max(len(self._word_ids), 1)
+        self._unigram_terms = np.full(word_count, -1, dtype=np.int64)
+        bigrams = {}
+        for term, term_id in self.terms.items():
+            words = term.split(' ')
+            if len(words) == 1:
+                self._unigram_terms[self._word_ids[term]] = term_id
+            else:
+                bigrams[self._word_ids[words[0]] * word_count + self._word_ids[words[1]]] = term_id
+        self._bigram_codes = np.array(sorted(bigrams), dtype=np.int64)
+        self._bigram_terms = np.array([bigrams[code] for code in self._bigram_codes.tolist()], dtype=np.int64)
+        self.page_count = len(next(iter(fields.values()))) if fields else 0
+        self.fields = {name: self._build(texts) for name, texts in fields.items()}
+
+    def _build(self, texts):
+        # All pages at once: word ids of the indexed words (-1 for others), unigram and
+        # bigram hits, then (page, term, count) triples
+        page_words = [_words(text) for text in texts]
+        lengths = np.array([len(words) for words in page_words], dtype=np.float64)
+        words = [word for words in page_words for word in words]
+        word_ids = np.array(list(map(self._word_ids.get, words, repeat(-1))), dtype=np.int64)
+        page_ids = np.repeat(np.arange(self.page_count), lengths.astype(np.int64))
+
+        known = word_ids >= 0
+        unigram_terms = self._unigram_terms[word_ids[known]]
+        unigram_pages = page_ids[known]
+        pair = known[:-1] & known[1:] & (page_ids[:-1] == page_ids[1:])
+        codes = word_ids[:-1][pair] * len(self._unigram_terms) + word_ids[1:][pair]
+        positions = np.minimum(np.searchsorted(self._bigram_codes, codes), max(len(self._bigram_codes) - 1, 0))
+        matched = self._bigram_codes[positions] == codes if len(self._bigram_codes) else np.zeros(len(codes), dtype=bool)
+        terms = np.concatenate([unigram_terms, self._bigram_terms[positions[matched]]])
+        pages = np.concatenate([unigram_pages, page_ids[:-1][pair][matched]])
+        pages, terms = pages[terms >= 0], terms[terms >= 0]
+
+        keys, counts = np.unique(pages * len(self.terms) + terms, return_counts=True)
+        return {
+            'pages': keys // max(len(self.terms), 1),
+            'terms': keys % max(len(self.terms), 1),
+            'counts': counts.astype(np.float64),
+            'lengths': lengths,
+            'average_length': max(lengths.mean(), 1.0) if self.page_count else 1.0,
+        }
+
+    def score(self, query_tokens, field):
+        # BM25 score of every page for the query
+        index = self.fields[field]
+        query_ids = np.array(sorted({self.terms[token] for token in query_tokens if token in self.terms}), dtype=np.int64)
+        scores = np.zeros(self.page_count)
+        if not len(query_ids):
+            return scores
+        mask = np.isin(index['terms'], query_ids)
+        pages, terms, counts = index['pages'][mask], index['terms'][mask], index['counts'][mask]
+        document_frequency = np.bincount(index['terms'], minlength=len(self.terms))
+        idf = np.log1p((self.page_count - document_frequency[terms] + 0.5) / (document_frequency[terms] + 0.5))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * index['lengths'][pages] / index['average_length'])
+        np.add.at(scores, pages, idf * counts * (BM25_K1 + 1) / (counts + norm))
+        return scores
+
+
+def index_report_pages(store, terms):
+    # Index the title zone and the full text (lines and table headers) of every stored page
+    pages = store.page_index["pages"]
+    header_texts = store.table_header_texts()
+    titles, bodies, has_tables = [], [], []
+    for idx in range(store.page_count):
+        lines = store.page_lines(idx)
+        table_indices = pages.get(idx, {}).get('table_indices', [])
+        titles.append(' '.join(lines[:TITLE_LINES]))
+        bodies.append(' '.join(lines + [header_texts[table_idx] for table_idx in table_indices]))
+        has_tables.append(bool(table_indices))
+    return PageIndex({'title': titles, 'body': bodies}, terms), np.array(has_tables, dtype=bool)
+
+
+def title_matches(index, variants):
+    # Pages whose title zone holds every phrase (every word of a one-word wording) of a variant
+    matches = np.zeros(index.page_count, dtype=bool)
+    for variant in variants:
+        tokens = tokenize(variant)
+        phrases = [token for token in tokens if ' ' in token] or tokens
+        if phrases:
+            matches |= np.all([index.score([phrase], 'title') > 0 for phrase in phrases], axis=0)
+    return matches
+
+
+def locate_statements(store, statement_variants):
+    # {label: {'start', 'end', 'confidence', 'titled'}} with start/end as page indices of the
+    # store, for every label of statement_variants ({label: [wordings]}) scoring on some page.
+    # 'titled' is False (and confidence 0) when no page the label owns carries its title.
+    queries = {
+        label: [token for variant in variants for token in tokenize(variant)]
+        for label, variants in statement_variants.items()
+    }
+    index, has_tables = index_report_pages(store, [token for query in queries.values() for token in query])
+    if not index.page_count:
+        return {}
+    title_scores, titled, scores, phrase_hits = {}, {}, {}, []
+    for label, query in queries.items():
+        title_scores[label] = index.score(query, 'title')
+        titled[label] = title_matches(index, statement_variants[label])
+        scores[label] = TITLE_WEIGHT * title_scores[label] + index.score(query, 'body')
+        phrases = [token for token in query if ' ' in token]
+        phrase_hits.append(index.score(phrases, 'body') > 0)
+
+    listing = np.sum(phrase_hits, axis=0) >= LISTING_LABELS
+    penalty = np.ones(index.page_count)
+    penalty[listing] *= LISTING_PENALTY
+    penalty[~has_tables] *= NO_TABLE_PENALTY
+
+    # Each page belongs to the statement scoring highest on it; a statement starts on the
+    # best titled page it owns, and its confidence compares that run with the best page it
+    # owns elsewhere, so a neighbouring statement with similar wording (profit or loss /
+    # comprehensive income) does not compete
+    labels = list(scores)
+    weighted = np.array([scores[label] for label in labels]) * penalty
+    owner = np.argmax(weighted, axis=0)
+    located = {}
+    for i, label in enumerate(labels):
+        label_scores = weighted[i]
+        owned = np.where(owner == i, label_scores, 0)
+        candidates = np.where(titled[label] & ~listing, owned, 0)
+        if candidates.max() <= 0:
+            # Not found: the best page is another statement's, a listing, or has no title naming this one
+            if label_scores.max() > 0:
+                start = int(np.argmax(label_scores))
+                located[label] = {'start': start, 'end': start, 'confidence': 0.0, 'titled': False}
+            continue
+        start = int(np.argmax(candidates))
+        best = label_scores[start]
+        end = start
+        while (end + 1 < index.page_count and end + 1 - start < MAX_STATEMENT_PAGES
+               and title_scores[label][end + 1] >= CONTINUATION_RATIO * title_scores[label][start] > 0):
+            end += 1
+        owned[max(0, start - 1):end + 2] = 0
+        located[label] = {'start': start, 'end': end, 'confidence': float(1 - owned.max() / best), 'titled': True}
+
+    # A statement ends before the next one starts
+    starts = sorted({entry['start'] for entry in located.values() if entry['titled']})
+    for entry in located.values():
+        later = [start for start in starts if start > entry['start']]
+        if later:
+            entry['end'] = min(entry['end'], later[0] - 1)
+    return located
@@ -0,0 +1,234 @@
+import json
+import mmap
+import os
+import pickle
+import numpy as np
+
+# Compact on-disk store for Document Intelligence results.
+# Only what the analysis reads is kept: page numbers, line text and table cells.
+# Text is concatenated into UTF-8 blobs and located through int64 offset arrays,
+# so ReportStore can memory-map everything and decode a single page or table on demand.
+STORE_DIR = 'data/annual_report_store'
+LEGACY_PKL_NAME = 'annual_report.pkl'
+STORE_VERSION = 1
+
+
+def _write_blob(path, texts):
+    # Write texts back to back and return the byte offsets (len(texts) + 1 entries)
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    with open(path, 'wb') as f:
+        for i, text in enumerate(texts):
+            data = (text or '').encode('utf-8')
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    return offsets
+
+
+def build_page_index(page_numbers, table_pages):
+    # page_number -> page_idx and page_idx -> {page_number, table_indices} in one pass.
+    # table_pages lists every page a table's bounding regions cover, so a table
+    # split across pages is listed under each of them.
+    page_indices = {}
+    pages = {}
+    for idx, page_number in enumerate(page_numbers):
+        page_indices.setdefault(int(page_number), idx)
+        pages[idx] = {"page_number": int(page_number), "table_indices": []}
+    for table_idx, table_page_numbers in enumerate(table_pages):
+        for page_number in dict.fromkeys(table_page_numbers):
+            idx = page_indices.get(int(page_number))
+            if idx is not None:
+                pages[idx]["table_indices"].append(table_idx)
+    return {"page_indices": page_indices, "pages": pages}
+
+
+def save_report_store(result_dict, store_dir=STORE_DIR):
+    tmp_dir = store_dir + '.tmp'
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    # Pages and lines
+    pages = result_dict.get('pages') or []
+    page_numbers = np.array([page['page_number'] for page in pages], dtype=np.int32)
+    page_line_offsets = np.zeros(len(pages) + 1, dtype=np.int64)
+    lines = []
+    for idx, page in enumerate(pages):
+        page_lines = page.get('lines') or []
+        lines.extend(line['content'] for line in page_lines)
+        page_line_offsets[idx + 1] = page_line_offsets[idx] + len(page_lines)
+    line_offsets = _write_blob(os.path.join(tmp_dir, 'line_text.bin'), lines)
+
+    # Tables, cells and the pages each table covers
+    tables = result_dict.get('tables') or []
+    table_shapes = np.zeros((len(tables), 2), dtype=np.int32)
+    table_cell_offsets = np.zeros(len(tables) + 1, dtype=np.int64)
+    table_region_offsets = np.zeros(len(tables) + 1, dtype=np.int64)
+    region_pages = []
+    cell_fields = []
+    cell_texts = []
+    for idx, table in enumerate(tables):
+        table_shapes[idx] = (table['row_count'], table['column_count'])
+        cells = table.get('cells') or []
+        for cell in cells:
+            cell_fields.append((
+                cell['row_index'],
+                cell['column_index'],
+                cell.get('row_span') or 1,
+                cell.get('column_span') or 1,
+                1 if cell.get('kind') == 'columnHeader' else 0,
+            ))
+            cell_texts.append(cell['content'])
+        table_cell_offsets[idx + 1] = table_cell_offsets[idx] + len(cells)
+        regions = table.get('bounding_regions') or []
+        region_pages.extend(region['page_number'] for region in regions)
+        table_region_offsets[idx + 1] = table_region_offsets[idx] + len(regions)
+    cells = np.array(cell_fields, dtype=np.int32).reshape(-1, 5)
+    cell_text_offsets = _write_blob(os.path.join(tmp_dir, 'cell_text.bin'), cell_texts)
+
+    arrays = {
+        'page_numbers': page_numbers,
+        'page_line_offsets': page_line_offsets,
+        'line_offsets': line_offsets,
+        'table_shapes': table_shapes,
+        'table_cell_offsets': table_cell_offsets,
+        'table_region_offsets': table_region_offsets,
+        'table_region_pages': np.array(region_pages, dtype=np.int32),
+        'cells': cells,
+        'cell_text_offsets': cell_text_offsets,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, name + '.npy'), array)
+
+    # Page/table index, built once here instead of on every analysis
+    table_pages = [
+        region_pages[table_region_offsets[idx]:table_region_offsets[idx + 1]]
+        for idx in range(len(tables))
+    ]
+    with open(os.path.join(tmp_dir, 'page_index.json'), 'w', encoding='utf-8') as f:
+        json.dump(build_page_index(page_numbers.tolist(), table_pages), f)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': STORE_VERSION, 'page_count': len(pages), 'table_count': len(tables)}, f, indent=4)
+
+    # Swap the finished store into place
+    if os.path.exists(store_dir):
+        old_dir = store_dir + '.old'
+        os.replace(store_dir, old_dir)
+        os.replace(tmp_dir, store_dir)
+        for name in os.listdir(old_dir):
+            os.remove(os.path.join(old_dir, name))
+        os.rmdir(old_dir)
+    else:
+        os.replace(tmp_dir, store_dir)
+    return store_dir
+
+
+class ReportStore:
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._arrays = {}
+        self._blobs = {}
+        self._page_index = None
+
+    def _array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.store_dir, name + '.npy'), mmap_mode='r')
+        return self._arrays[name]
+
+    def _text(self, blob, start, end):
+        if start == end:
+            return ''
+        if blob not in self._blobs:
+            with open(os.path.join(self.store_dir, blob), 'rb') as f:
+                self._blobs[blob] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._blobs[blob][start:end].decode('utf-8')
+
+    @property
+    def page_count(self):
+        return self.meta['page_count']
+
+    @property
+    def table_count(self):
+        return self.meta['table_count']
+
+    @property
+    def page_index(self):
+        # {"page_indices": {page_number: page_idx}, "pages": {page_idx: {"page_number", "table_indices"}}}
+        if self._page_index is None:
+            path = os.path.join(self.store_dir, 'page_index.json')
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                # JSON object keys are strings
+                self._page_index = {
+                    "page_indices": {int(k): v for k, v in index["page_indices"].items()},
+                    "pages": {int(k): v for k, v in index["pages"].items()},
+                }
+            else:
+                table_pages = [self.table_page_numbers(idx) for idx in range(self.table_count)]
+                self._page_index = build_page_index(self._array('page_numbers').tolist(), table_pages)
+        return self._page_index
+
+    def page_idx(self, page_number):
+        return self.page_index["page_indices"].get(int(page_number))
+
+    def page_number(self, page_idx):
+        return int(self._array('page_numbers')[page_idx])
+
+    def page_lines(self, page_idx):
+        page_line_offsets = self._array('page_line_offsets')
+        line_offsets = self._array('line_offsets')
+        first, last = int(page_line_offsets[page_idx]), int(page_line_offsets[page_idx + 1])
+        return [
+            self._text('line_text.bin', int(line_offsets[i]), int(line_offsets[i + 1]))
+            for i in range(first, last)
+        ]
+
+    def page_text(self, page_idx):
+        return ' '.join(self.page_lines(page_idx))
+
+    def table_page_numbers(self, table_idx):
+        offsets = self._array('table_region_offsets')
+        return [int(p) for p in self._array('table_region_pages')[offsets[table_idx]:offsets[table_idx + 1]]]
+
+    def table_header_texts(self):
+        # Text of every table's column header cells, without rebuilding the tables
+        header_cells = np.flatnonzero(np.asarray(self._array('cells')[:, 4]))
+        cell_tables = np.searchsorted(self._array('table_cell_offsets'), header_cells, side='right') - 1
+        text_offsets = self._array('cell_text_offsets')
+        texts = [[] for _ in range(self.table_count)]
+        for cell, table_idx in zip(header_cells.tolist(), cell_tables.tolist()):
+            texts[table_idx].append(self._text('cell_text.bin', int(text_offsets[cell]), int(text_offsets[cell + 1])))
+        return [' '.join(table_texts) for table_texts in texts]
+
+    def table(self, table_idx):
+        # Rebuild the table in the same shape as result.to_dict()['tables'][table_idx]
+        row_count, column_count = (int(v) for v in self._array('table_shapes')[table_idx])
+        offsets = self._array('table_cell_offsets')
+        first, last = int(offsets[table_idx]), int(offsets[table_idx + 1])
+        fields = np.asarray(self._array('cells')[first:last])
+        text_offsets = self._array('cell_text_offsets')
+        cells = []
+        for i, (row_index, column_index, row_span, column_span, is_header) in enumerate(fields.tolist(), start=first):
+            cells.append({
+                'kind': 'columnHeader' if is_header else 'content',
+                'row_index': row_index,
+                'column_index': column_index,
+                'row_span': row_span,
+                'column_span': column_span,
+                'content': self._text('cell_text.bin', int(text_offsets[i]), int(text_offsets[i + 1])),
+            })
+        return {
+            'row_count': row_count,
+            'column_count': column_count,
+            'cells': cells,
+            'bounding_regions': [{'page_number': p} for p in self.table_page_numbers(table_idx)],
+        }
+
+
+def load_report_store(store_dir=STORE_DIR):
+    # Open the store, converting a report parsed before the store existed if needed
+    legacy_pkl_path = os.path.join(os.path.dirname(os.path.normpath(store_dir)), LEGACY_PKL_NAME)
+    if not os.path.exists(os.path.join(store_dir, 'meta.json')) and os.path.exists(legacy_pkl_path):
+        with open(legacy_pkl_path, 'rb') as pkl_file:
+            save_report_store(pickle.load(pkl_file), store_dir)
+    return ReportStore(store_dir)
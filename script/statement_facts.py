@@ -0,0 +1,296 @@
+import re
+import numpy as np
+import pandas as pd
+from script.tables import assemble_table_grid, stacked_header
+
+# Typed figures from the financial statement tables, so that the LLM comments on
+# numbers computed here instead of doing the arithmetic on markdown tables.
+# Each table becomes a frame with one row per line item and one column per year,
+# in millions of the reporting currency: "(1,234)" is negative, dashes are zero,
+# thousands separators and currency prefixes are dropped, and a "HK$'000" or
+# "HK$ billion" unit header rescales the table. Rows are mapped to the canonical
+# line items of the insights prompt, and ratios and year-over-year changes are
+# computed on the whole frame at once.
+STATEMENT_TITLES = {
+    'profit_or_loss': 'CONSOLIDATED STATEMENT OF PROFIT OR LOSS',
+    'comprehensive_income': 'CONSOLIDATED STATEMENT OF COMPREHENSIVE INCOME',
+    'financial_position': 'CONSOLIDATED STATEMENT OF FINANCIAL POSITION',
+    'changes_in_equity': 'CONSOLIDATED STATEMENT OF CHANGES IN EQUITY',
+    'cash_flow': 'CONSOLIDATED STATEMENT OF CASH FLOWS',
+}
+
+_DEBT = r'loans|borrowings|bonds|notes payable|lease liabilities|obligations under|overdrafts'
+_SHAREHOLDERS = r'(?:shareholders|equity holders|owners) of the (?:company|parent)'
+
+# key: (statements searched in order, row label pattern, section pattern or None, 'first' or 'sum').
+# 'sum' adds up every matching row unless one of them is already a total.
+LINE_ITEMS = {
+    'revenue': (('profit_or_loss',), r'^(?:total )?revenue|^turnover', None, 'first'),
+    'profit_before_taxation': (('profit_or_loss',), r'^profit before (?:income )?tax', None, 'first'),
+    'interest_expense': (('profit_or_loss',), r'interest (?:expense|and finance charges)|finance (?:costs|charges)', None, 'first'),
+    'fair_value_change_investment_properties': (('profit_or_loss',), r'(?:fair value|revaluation).*investment propert', None, 'first'),
+    'net_income': (('profit_or_loss',), _SHAREHOLDERS, None, 'first'),
+    'depreciation_amortisation': (('profit_or_loss',), r'depreciation|amorti[sz]ation', None, 'sum'),
+    'total_assets': (('financial_position',), r'^total assets', None, 'first'),
+    'cash_and_equivalents': (('financial_position',), r'^cash and (?:cash equivalents|bank balances)', None, 'first'),
+    'short_term_debt': (('financial_position',), _DEBT, r'^current liabilities', 'sum'),
+    'total_debt': (('financial_position',), _DEBT, None, 'sum'),
+    'net_assets': (('financial_position',), _SHAREHOLDERS, None, 'first'),
+    'non_controlling_interests': (('financial_position',), r'non-controlling interests|minority interests', None, 'first'),
+    'goodwill': (('financial_position',), r'goodwill', None, 'first'),
+    'intangible_assets': (('financial_position',), r'intangible assets', None, 'first'),
+    'share_capital': (('financial_position',), r'^share capital', None, 'first'),
+    'deferred_tax_assets': (('financial_position',), r'^deferred tax assets', None, 'first'),
+    'total_equity': (('changes_in_equity', 'financial_position'), r'^total equity|^total$', None, 'first'),
+    'retained_earnings': (('changes_in_equity', 'financial_position'), r'retained (?:profits|earnings)', None, 'first'),
+    'operating_cash_flow': (('cash_flow',), r'^net cash .*operating activities', None, 'first'),
+    'interest_paid': (('cash_flow',), r'interests? (?:and other finance charges )?paid', None, 'sum'),
+    'capital_expenditure': (('cash_flow',), r'(?:purchase|acquisition|addition)s? of (?:property|plant|fixed assets|investment propert|intangible)|capital (?:expenditure|projects)', None, 'sum'),
+    'principal_payment': (('cash_flow',), r'repayments? of (?:loans|borrowings|bank|bonds|notes)|principal (?:element|portion)', None, 'sum'),
+    'dividend_paid': (('cash_flow',), r'dividends? paid', None, 'sum'),
+}
+# Items reported as outflows; their magnitude is used in the computed figures
+OUTFLOWS = ['interest_expense', 'depreciation_amortisation', 'interest_paid', 'capital_expenditure', 'principal_payment', 'dividend_paid']
+# Ratios shown as multiples, the others as percentages
+MULTIPLE_RATIOS = {'interest_cover', 'debt_to_equity', 'net_debt_to_equity', 'cash_conversion'}
+
+# Scale of a unit header relative to one million
+UNIT_SCALES = [
+    (re.compile(r"'000|’000|thousand", re.IGNORECASE), 1e-3),
+    (re.compile(r'\b(bn|billion)\b', re.IGNORECASE), 1e3),
+]
+CURRENCY_PATTERN = re.compile(r'(HK\$|US\$|RMB|S\$)', re.IGNORECASE)
+DEFAULT_CURRENCY = 'HK$'
+
+_YEAR_PATTERN = r'\b((?:19|20)\d{2})\b'
+_BALANCE_PATTERN = r'\bat\b.*\b(?:19|20)\d{2}\b'
+_NOTE_PATTERN = r'\(?\bnotes?\s*\d[\d(),.\sa-z]*\)?$'
+
+
+def parse_numbers(values):
+    # Series of cell texts -> floats; dashes and 'nil' are zero, other text is NaN
+    text = values.fillna('').astype(str).str.strip()
+    text = text.str.replace(r'^(?:HK\$|US\$|RMB|S\$|\$)', '', regex=True, case=False)
+    text = text.str.replace(r'[\s,*]', '', regex=True).str.replace('−', '-', regex=False)
+    dash = text.str.fullmatch(r'[-–—]+|nil', case=False)
+    text = text.str.replace(r'^\((.*)\)$', r'-\1', regex=True)
+    numbers = pd.to_numeric(text, errors='coerce')
+    numbers[dash] = 0.0
+    return numbers.astype(float)
+
+
+def normalize_labels(labels):
+    labels = pd.Series(labels, dtype=object).fillna('').astype(str).str.lower()
+    labels = labels.str.replace('’', "'", regex=False).str.replace(_NOTE_PATTERN, '', regex=True)
+    return labels.str.replace(r'[\s:]+', ' ', regex=True).str.strip()
+
+
+def table_unit(texts):
+    # (currency, scale to millions) named in the header texts
+    text = ' '.join(texts)
+    currency = CURRENCY_PATTERN.search(text)
+    currency = currency.group(1).upper() if currency else DEFAULT_CURRENCY
+    scale = next((scale for pattern, scale in UNIT_SCALES if pattern.search(text)), 1.0)
+    return currency, scale
+
+
+def table_frame(table):
+    # Frame with 'section' and 'label' columns and one float column per year, or None
+    # when the table has no year columns nor year balance rows (changes in equity)
+    grid, header_count = assemble_table_grid(table)
+    if len(grid) <= header_count:
+        return None, None
+    header = stacked_header(grid, header_count)
+    body = pd.DataFrame(grid[header_count:])
+    years = pd.Series(header).str.extract(_YEAR_PATTERN)[0]
+    label_col = int(np.flatnonzero(years.isna().to_numpy())[0]) if years.isna().any() else 0
+    labels = normalize_labels(body[label_col])
+    currency, scale = table_unit(header + body[label_col].head(3).tolist())
+
+    year_cols = [col for col in years.dropna().index if col != label_col]
+    if year_cols:
+        # One column per year; a second column of the same year (e.g. Company after Group) is dropped
+        year_cols = list(pd.Series(year_cols, index=years[year_cols].astype(int)).groupby(level=0).first())
+        values = body[year_cols].apply(parse_numbers) * scale
+        values.columns = years[year_cols].astype(int).tolist()
+        empty = values.isna().all(axis=1)
+        # Rows without figures are section headings ("Current liabilities")
+        section = labels.where(empty, '').groupby(empty.cumsum()).transform('first')
+        frame = pd.DataFrame({'section': section, 'label': labels})
+        frame = pd.concat([frame, values], axis=1)[~empty & (labels != '')]
+    else:
+        # Components in the columns, balances in rows such as "At 31 December 2023"
+        balances = labels.str.contains(_BALANCE_PATTERN, regex=True)
+        if not balances.any():
+            return None, currency
+        balance_years = labels[balances].str.extract(_YEAR_PATTERN)[0].astype(int)
+        value_cols = [col for col in range(len(header)) if col != label_col and header[col].strip()]
+        values = body.loc[balances, value_cols].apply(parse_numbers) * scale
+        values.index = balance_years
+        values = values.groupby(level=0).last().T  # the closing balance is the year's last row
+        frame = pd.concat([pd.DataFrame({
+            'section': '', 'label': normalize_labels([header[col] for col in value_cols]).tolist(),
+        }, index=values.index), values], axis=1)
+    frame.columns = [col if isinstance(col, str) else int(col) for col in frame.columns]
+    return frame.reset_index(drop=True), currency
+
+
+def statement_frames(statement_tables):
+    # {statement label: frame of all its tables} and the reporting currency
+    frames, currencies = {}, []
+    for label, tables in statement_tables.items():
+        parts = []
+        for table in tables:
+            frame, currency = table_frame(table)
+            if frame is not None:
+                parts.append(frame)
+                currencies.append(currency)
+        if parts:
+            frames[label] = pd.concat(parts, ignore_index=True)
+    currency = max(set(currencies), key=currencies.count) if currencies else DEFAULT_CURRENCY
+    return frames, currency
+
+
+def _year_columns(frame):
+    return sorted((col for col in frame.columns if isinstance(col, int)), reverse=True)
+
+
+def extract_line_items(frames):
+    # Frame of the canonical line items (rows) by year (columns), NaN where not reported
+    items = {}
+    for key, (statements, pattern, section_pattern, how) in LINE_ITEMS.items():
+        for statement in statements:
+            frame = frames.get(statement)
+            if frame is None:
+                continue
+            match = frame['label'].str.contains(pattern, regex=True)
+            if section_pattern:
+                match &= frame['section'].str.contains(section_pattern, regex=True)
+            if not match.any():
+                continue
+            rows = frame.loc[match, _year_columns(frame)]
+            totals = frame.loc[match, 'label'].str.startswith('total')
+            if how == 'first':
+                items[key] = rows.iloc[0]
+            elif totals.any():
+                items[key] = rows[totals].iloc[0]
+            else:
+                items[key] = rows.sum(min_count=1)
+            break
+    result = pd.DataFrame(items).T.reindex(list(LINE_ITEMS))
+    return result[sorted(result.columns, reverse=True)] if len(result.columns) else result
+
+
+def compute_figures(items):
+    # Derived amounts and ratios by year, from the line items
+    values = items.copy()
+    outflows = values.index.intersection(OUTFLOWS)
+    values.loc[outflows] = values.loc[outflows].abs()
+
+    def item(key):
+        return values.loc[key]
+
+    profit_before_tax_and_interest = item('profit_before_taxation') + item('interest_expense')
+    net_debt = item('total_debt') - item('cash_and_equivalents')
+    amounts = pd.DataFrame({
+        'profit_before_tax_and_interest': profit_before_tax_and_interest,
+        'ebitda': profit_before_tax_and_interest + item('depreciation_amortisation'),
+        'net_debt': net_debt,
+        'free_cash_flow': item('operating_cash_flow') - item('capital_expenditure'),
+    }).T
+    ratios = pd.DataFrame({
+        'net_margin': item('net_income') / item('revenue'),
+        'interest_cover': profit_before_tax_and_interest / item('interest_expense'),
+        'debt_to_equity': item('total_debt') / item('total_equity'),
+        'net_debt_to_equity': net_debt / item('total_equity'),
+        'return_on_equity': item('net_income') / item('net_assets'),
+        'return_on_assets': item('net_income') / item('total_assets'),
+        'cash_conversion': item('operating_cash_flow') / item('net_income'),
+        'dividend_payout': item('dividend_paid') / item('net_income'),
+    }).T
+    return amounts, ratios.replace([np.inf, -np.inf], np.nan)
+
+
+def year_over_year(frame):
+    # Change and relative change from the previous to the latest year
+    years = _year_columns(frame)
+    if len(years) < 2:
+        return pd.DataFrame(index=frame.index, columns=['change', 'pct_change'], dtype=float)
+    latest, previous = frame[years[0]], frame[years[1]]
+    change = latest - previous
+    pct_change = (change / previous.abs()).replace([np.inf, -np.inf], np.nan)
+    return pd.DataFrame({'change': change, 'pct_change': pct_change})
+
+
+def statement_facts(statement_tables):
+    # {'items', 'amounts', 'ratios'} frames by year and the unit of the amounts
+    frames, currency = statement_frames(statement_tables)
+    items = extract_line_items(frames)
+    amounts, ratios = compute_figures(items)
+    return {'items': items, 'amounts': amounts, 'ratios': ratios}, f"{currency} million"
+
+
+def _amount(value):
+    return f"{value:,.0f}" if float(value).is_integer() else f"{value:,.1f}"
+
+
+def _format_rows(frame, value_format, change_format):
+    changes = year_over_year(frame)
+    lines = []
+    for key, row in frame.iterrows():
+        values = [f"{year} {value_format(key, value)}" for year, value in row.items() if pd.notna(value)]
+        if not values:
+            continue
+        change = changes.loc[key]
+        if pd.notna(change['change']):
+            values.append(f"change {change_format(key, change)}")
+        lines.append(f"{key}: " + ' | '.join(values))
+    return lines
+
+
+def _amount_value(key, value):
+    return _amount(value)
+
+
+def _amount_change(key, change):
+    text = f"{'+' if change['change'] >= 0 else ''}{_amount(change['change'])}"
+    return text + (f" ({change['pct_change']:+.1%})" if pd.notna(change['pct_change']) else '')
+
+
+def _ratio_value(key, value):
+    return f"{value:.2f}x" if key in MULTIPLE_RATIOS else f"{value:.1%}"
+
+
+def _ratio_change(key, change):
+    return f"{change['change']:+.2f}x" if key in MULTIPLE_RATIOS else f"{change['change'] * 100:+.1f} pts"
+
+
+def format_facts(facts, unit):
+    # Compact text of the computed figures, grouped like the insights prompt
+    lines = [f"Amounts in {unit}, computed from the statement tables."]
+    items = facts['items']
+    for statement, title in STATEMENT_TITLES.items():
+        keys = [key for key, spec in LINE_ITEMS.items() if spec[0][0] == statement]
+        rows = _format_rows(items.loc[keys], _amount_value, _amount_change)
+        if rows:
+            lines.append(f"[STATEMENT] {title}")
+            lines.extend(rows)
+    for heading, frame, value_format, change_format in [
+        ('[DERIVED AMOUNTS]', facts['amounts'], _amount_value, _amount_change),
+        ('[RATIOS]', facts['ratios'], _ratio_value, _ratio_change),
+    ]:
+        rows = _format_rows(frame, value_format, change_format)
+        if rows:
+            lines.append(heading)
+            lines.extend(rows)
+    return '\n'.join(lines)
+
+
+def unparsed_statements(facts, labels):
+    # Labels of statements that have canonical line items but none of them was found
+    found = facts['items'].dropna(how='all').index
+    return [
+        label for label in labels
+        if any(spec[0][0] == label for spec in LINE_ITEMS.values())
+        and not any(LINE_ITEMS[key][0][0] == label for key in found)
+    ]
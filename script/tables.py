@@ -0,0 +1,41 @@
+# Layout of Document Intelligence tables (result.to_dict()['tables'] entries), shared
+# by the markdown rendering and the numeric extraction of the statement tables.
+
+
+def assemble_table_grid(table):
+    # Place every cell in a row_count x column_count grid in a single pass over the cells.
+    # Spanned header cells are repeated across the columns they cover so that stacked
+    # headers line up; spanned body cells keep their value in the first slot only.
+    row_count = table.get('row_count', 0)
+    column_count = table.get('column_count', 0)
+    cells = table.get('cells', [])
+    for cell in cells:
+        row_count = max(row_count, cell['row_index'] + (cell.get('row_span') or 1))
+        column_count = max(column_count, cell['column_index'] + (cell.get('column_span') or 1))
+
+    grid = [[''] * column_count for _ in range(row_count)]
+    header_rows = set()
+    for cell in cells:
+        row, col = cell['row_index'], cell['column_index']
+        grid[row][col] = cell['content']
+        if cell.get('kind') == 'columnHeader':
+            header_rows.add(row)
+            for span_col in range(col + 1, col + (cell.get('column_span') or 1)):
+                grid[row][span_col] = cell['content']
+    # Leading rows made of header cells form the header, row 0 always does
+    header_count = 1
+    while header_count in header_rows:
+        header_count += 1
+    return grid, min(header_count, row_count)
+
+
+def stacked_header(grid, header_count):
+    # Stack multi-row headers into one header text per column
+    header = []
+    for col in range(len(grid[0]) if grid else 0):
+        parts = []
+        for row in range(header_count):
+            if grid[row][col] and (not parts or parts[-1] != grid[row][col]):
+                parts.append(grid[row][col])
+        header.append(' '.join(parts))
+    return header